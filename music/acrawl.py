@@ -0,0 +1,156 @@
+"""Asynchronous (asyncio) versions of crawl.crawl() and crawl.get_m_info(), for use inside an event loop.
+The blocking fetching and parsing of each page run in a bounded thread pool (see run_in_order()),
+so the event loop is not blocked by them (it only competes with the parsing threads for the GIL),
+and no thread is created per request.
+asyncio documentation: https://docs.python.org/3/library/asyncio.html
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import time
+
+from music.crawl import MOVIE_ITEMS, crawl, create_session, get_next_soup, get_page_m_info, get_specific_page
+from music.standin import StandInServer
+
+
+async def run_in_order(function, args_list, max_in_flight=4):
+    """Async generator that yields function(*args) for each args tuple from the iterable args_list, in order,
+    with up to max_in_flight calls running concurrently in a pool of max_in_flight threads.
+    If the generator is closed (e.g., the consumer breaks out of async for) or the task consuming it is cancelled,
+    the calls that haven't started yet are cancelled, and the pool is shut down without waiting for the others.
+    """
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    args_list = iter(args_list)
+    in_flight = deque()
+    try:
+        for args in islice(args_list, max_in_flight):
+            in_flight.append(loop.run_in_executor(executor, function, *args))
+        while in_flight:
+            result = await in_flight.popleft()
+            for args in islice(args_list, 1):
+                in_flight.append(loop.run_in_executor(executor, function, *args))
+            yield result
+    finally:
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def acrawl(url: str, max_pages=1, max_in_flight=4, session=None, parse_only=None, first_page=1):
+    """Async generator version of crawl.crawl() (with the same parameters), to be used with async for:
+    yields the BeautifulSoup objects of the pages in page order, with up to max_in_flight pages
+    fetched and parsed concurrently.
+    """
+
+    async for soup in run_in_order(get_next_soup, ((url, page, session, parse_only)
+                                                   for page in range(first_page, max_pages + 1)), max_in_flight):
+        yield soup
+
+
+def get_next_m_info(start_url: str, page=1, session=None, targeted=False):
+    """Returns the list of 4-tuples (title, year, link, poster link) of the movies from a specific page
+    of a multi-page IMDb movie list (see crawl.get_next_soup() and crawl.get_page_m_info()).
+    """
+
+    soup = get_next_soup(start_url, page, session, MOVIE_ITEMS if targeted else None)
+    page_info = get_page_m_info(soup, get_specific_page(start_url, page))
+    soup.decompose()
+    return page_info
+
+
+async def aiter_m_info(start_url: str, max_pages=1, max_in_flight=4, session=None, targeted=False):
+    """Async generator version of crawl.iter_m_info() (with the same parameters): yields the 4-tuples
+    (title, year, link, poster link) page by page; the movies are extracted in the thread pool too,
+    so the event loop only receives the tuples.
+    """
+
+    async for page_info in run_in_order(get_next_m_info, ((start_url, page, session, targeted)
+                                                          for page in range(1, max_pages + 1)), max_in_flight):
+        for info in page_info:
+            yield info
+
+
+async def aget_m_info(start_url: str, max_pages=1, max_in_flight=4, session=None, targeted=False):
+    """Async version of crawl.get_m_info() (with the same parameters):
+        movies = await aget_m_info(start_url, max_pages=10)
+    """
+
+    return [info async for info in aiter_m_info(start_url, max_pages, max_in_flight, session, targeted)]
+
+
+async def measure_loop_stall(coroutine, interval=0.005):
+    """Runs coroutine while a heartbeat task wakes up every interval seconds.
+    Returns a 2-tuple (<time in seconds>, <the longest delay of the heartbeat, in seconds>), where the delay
+    shows how long the event loop was blocked.
+    """
+
+    max_stall = 0.0
+    last_beat = time.perf_counter()
+
+    async def heartbeat():
+        nonlocal max_stall, last_beat
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            max_stall = max(max_stall, now - last_beat - interval)
+            last_beat = now
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)                                  # let the heartbeat start
+    start = last_beat = time.perf_counter()
+    await coroutine
+    seconds = time.perf_counter() - start
+    max_stall = max(max_stall, time.perf_counter() - last_beat - interval)   # e.g., if the loop was blocked all along
+    heartbeat_task.cancel()
+    return seconds, max_stall
+
+
+def benchmark_acrawl(n_pages=20, latency=0.05, max_in_flight=4):
+    """Crawls a synthetic movie list of n_pages pages from a local stand-in server (music.standin) inside
+    an event loop, with the blocking crawl.crawl() and with acrawl().
+    Returns a dict: {<crawl>: (<time in seconds>, <the longest time the event loop was blocked, in seconds>)}.
+    """
+
+    async def crawl_blocking(url, session):
+        return list(crawl(url, n_pages, max_in_flight, session))
+
+    async def crawl_async(url, session):
+        return [soup async for soup in acrawl(url, n_pages, max_in_flight, session)]
+
+    async def run_all():
+        results = {}
+        with StandInServer(latency=latency, n_pages=n_pages) as server, \
+                create_session(pool_maxsize=max_in_flight) as session:
+            for name, coroutine in (('crawl()', crawl_blocking), ('acrawl()', crawl_async)):
+                results[name] = await measure_loop_stall(coroutine(server.start_url, session))
+        return results
+
+    return asyncio.run(run_all())
+
+
+if __name__ == "__main__":
+
+    async def main():
+        with StandInServer(latency=0.05, n_pages=10) as server:
+
+            # Crawl a synthetic movie list on the local stand-in server
+            movies = await aget_m_info(server.start_url, max_pages=10)
+            print(len(movies), movies[0])
+
+            # Cancel a crawl after 0.2 s
+            requests_count = server.requests_count
+            try:
+                await asyncio.wait_for(aget_m_info(server.start_url, max_pages=10, max_in_flight=2), timeout=0.2)
+            except asyncio.TimeoutError:
+                print(f'Cancelled after {server.requests_count - requests_count} requests')
+
+    asyncio.run(main())
+    print()
+
+    # # Benchmark
+    # for name, (seconds, max_stall) in benchmark_acrawl().items():
+    #     print(f'{name:10}{seconds:8.2f} s, event loop blocked for up to {max_stall * 1000:8.2f} ms')
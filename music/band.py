@@ -3,6 +3,7 @@ It includes a list of Musician objects (band members) and the date when the band
 """
 
 from datetime import date, datetime, time
+import copyreg
 import json
 
 from music.musician import Musician, musician_json_to_py, musician_py_to_json
@@ -110,6 +111,33 @@ class Band:
 
         return date(1960, 1, 1) < d < date.today()
 
+    # Pickling support: the minimal state (the iterator counter, self.__i, is not part of it), just the values
+    # of the data fields for Band objects that have exactly these fields; objects of the subclasses of Band
+    # and objects with other fields set on them are pickled with their __dict__ (still without self.__i)
+    pickle_fields = ('name', 'members', 'formed', 'split')
+
+    def __getstate__(self):
+        d = self.__dict__
+        if type(self) is Band and len(d) - ('_Band__i' in d) == len(Band.pickle_fields):
+            try:
+                return d['name'], d['members'], d['formed'], d['split']
+            except KeyError:
+                pass
+        return {k: v for k, v in d.items() if k != '_Band__i'}
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            self.__dict__.update(state)
+        else:
+            self.name, self.members, self.formed, self.split = state
+
+    def __reduce_ex__(self, protocol):
+        d = self.__dict__
+        if type(self) is Band and len(d) - ('_Band__i' in d) == 4 and \
+                'name' in d and 'members' in d and 'formed' in d and 'split' in d:       # __getstate__(), inlined
+            return copyreg.__newobj__, (Band,), (d['name'], d['members'], d['formed'], d['split'])
+        return copyreg.__newobj__, (type(self),), self.__getstate__()
+
     def __iter__(self):
         self.__i = 0
         return self
@@ -0,0 +1,283 @@
+"""Compact binary file format for rosters of musicians and bands, read through a memory-mapped file.
+The file consists of:
+- a header: magic bytes, format version, number of musicians, number of bands
+- fixed-width musician records: offset and length of the name in the string heap, kind of musician,
+  is_band_member, vocals and instrument codes
+- fixed-width band records: offset and length of the name in the string heap, index of the first member
+  in the member index array, number of members, formed and split
+- the member index array (indices of musician records)
+- the string heap (UTF-8 encoded names)
+Since all records have the same width, the i-th record is found by simple arithmetic,
+and only the records (and names) that are actually accessed are ever decoded.
+"""
+
+from datetime import date
+import mmap
+import os
+import struct
+
+from music.band import Band
+from music.enums import Vocals, Instrument
+from music.musician import Musician, SingerSongwriter, \
+    ENUM_CODES, ENUM_VALUES, KINDS, get_kind_code, create_musician
+from util.utility import get_data_file, measure_time
+
+MAGIC = b'MUSC'
+VERSION = 1
+HEADER = struct.Struct('<4sHxxII')                  # magic, version, (padding), number of musicians, number of bands
+MUSICIAN_RECORD = struct.Struct('<IIBBBB')          # name offset, name length, kind, is_band_member, vocals, instrument
+BAND_RECORD = struct.Struct('<IIIIii')              # name offset, name length, first member, members, formed, split
+MEMBER_INDEX = struct.Struct('<I')
+
+NO_ENUM = 255                                       # enum code of None (e.g., the vocals of a Songwriter)
+
+
+class RosterFileError(Exception):
+    """Exception raised when a file is not a roster file written by write_roster().
+    """
+
+    def __init__(self, file, message):
+        super().__init__(f'{file}: {message}')
+
+
+def date_py_to_int(d):
+    """Converts the formed/split data field of a band to int: 0 if unknown,
+    the year itself if it's an int (a year), or date.toordinal() (always > 9999, so it can't be mistaken for a year).
+    """
+
+    return d.toordinal() if isinstance(d, date) else d if isinstance(d, int) else 0
+
+
+def date_int_to_py(i):
+    """Inverse of date_py_to_int(); unknown dates are decoded as 'unknown', as in Band.parse_band_str().
+    """
+
+    return date.fromordinal(i) if i > 9999 else i if i > 0 else 'unknown'
+
+
+def write_roster(file_name, musicians=(), bands=()):
+    """Writes musicians and bands to a binary roster file (see the module docstring for the format).
+    Relative file names are located in the data directory. Members of the bands are written as musician records
+    too (just once, even if they are members of several bands or are also in musicians).
+    Returns the Path object of the file.
+    """
+
+    indices = {}
+    roster = []
+
+    def index_of(m):
+        i = indices.get(id(m))
+        if i is None:
+            i = indices[id(m)] = len(roster)
+            roster.append(m)
+        return i
+
+    for m in musicians:
+        index_of(m)
+    member_indices = [[index_of(m) for m in band.members] for band in bands]
+
+    heap = bytearray()
+    heap_offsets = {}
+
+    def add_to_heap(s):
+        encoded = s.encode('utf-8')
+        offset = heap_offsets.get(s)
+        if offset is None:
+            offset = heap_offsets[s] = len(heap)
+            heap.extend(encoded)
+        return offset, len(encoded)
+
+    out = bytearray(HEADER.pack(MAGIC, VERSION, len(roster), len(bands)))
+    for m in roster:
+        vocals = getattr(m, 'vocals', None)
+        instrument = getattr(m, 'instrument', None)
+        out += MUSICIAN_RECORD.pack(*add_to_heap(m.name), get_kind_code(m), bool(m.is_band_member),
+                                    NO_ENUM if vocals is None else ENUM_CODES[vocals],
+                                    NO_ENUM if instrument is None else ENUM_CODES[instrument])
+    first_member = 0
+    for band, members in zip(bands, member_indices):
+        out += BAND_RECORD.pack(*add_to_heap(band.name), first_member, len(members),
+                                date_py_to_int(band.formed), date_py_to_int(band.split))
+        first_member += len(members)
+    for members in member_indices:
+        for i in members:
+            out += MEMBER_INDEX.pack(i)
+    out += heap
+
+    file = get_data_file(file_name)
+    file.write_bytes(out)
+    return file
+
+
+class RosterFile:
+    """The class describing an open binary roster file (see write_roster()).
+    The file is memory-mapped and read through memoryview slices; musicians and bands are decoded lazily,
+    only when they are accessed, so opening even a very large file is instant.
+    Use it as a context manager, or call close() when done. All memoryview slices returned by
+    get_raw_musician() must be released before closing the file.
+    """
+
+    def __init__(self, file_name):
+        self.file = get_data_file(file_name)
+        with open(self.file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:      # (an empty file can't even be memory-mapped)
+                raise RosterFileError(self.file, 'file too short')
+            self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__view = memoryview(self.__mmap)
+        magic, version, self.n_musicians, self.n_bands = HEADER.unpack_from(self.__view)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise RosterFileError(self.file, f'not a roster file (version {VERSION})')
+        self.__musicians_start = HEADER.size
+        self.__bands_start = self.__musicians_start + self.n_musicians * MUSICIAN_RECORD.size
+        self.__members_start = self.__bands_start + self.n_bands * BAND_RECORD.size
+        if len(self.__view) < self.__members_start:
+            self.close()
+            raise RosterFileError(self.file, 'file truncated (musician or band records missing)')
+        n_member_indices = BAND_RECORD.unpack_from(self.__view, self.__members_start - BAND_RECORD.size)[2:4] \
+            if self.n_bands else (0, 0)
+        self.__heap_start = self.__members_start + sum(n_member_indices) * MEMBER_INDEX.size
+        if len(self.__view) < self.__heap_start:
+            self.close()
+            raise RosterFileError(self.file, 'file truncated (member indices missing)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.n_musicians
+
+    def __str__(self):
+        return f'Roster file {self.file.name}: {self.n_musicians} musicians, {self.n_bands} bands'
+
+    def close(self):
+        self.__view.release()
+        self.__mmap.close()
+
+    def __get_string(self, offset, length):
+        start = self.__heap_start + offset
+        if start + length > len(self.__view):                  # the heap has no recorded size; check each string
+            raise RosterFileError(self.file, 'file truncated (string heap)')
+        return str(self.__view[start:start + length], 'utf-8')
+
+    def get_raw_musician(self, i):
+        """Returns the i-th musician record as a memoryview slice of the file (no copying, no decoding).
+        """
+
+        if not 0 <= i < self.n_musicians:
+            raise IndexError('musician index out of range')
+        start = self.__musicians_start + i * MUSICIAN_RECORD.size
+        return self.__view[start:start + MUSICIAN_RECORD.size]
+
+    def get_name(self, i):
+        """Returns the name of the i-th musician, decoding just the name.
+        """
+
+        offset, length, *_ = MUSICIAN_RECORD.unpack(self.get_raw_musician(i))
+        return self.__get_string(offset, length)
+
+    def get_musician(self, i):
+        """Returns the i-th musician, as an object of the class of musician it was written from
+        (objects of the slotted classes are read as objects of the corresponding regular classes).
+        """
+
+        offset, length, kind, is_band_member, vocals, instrument = MUSICIAN_RECORD.unpack(self.get_raw_musician(i))
+        return create_musician(KINDS[kind], self.__get_string(offset, length), bool(is_band_member),
+                               None if vocals == NO_ENUM else ENUM_VALUES[Vocals][vocals],
+                               None if instrument == NO_ENUM else ENUM_VALUES[Instrument][instrument])
+
+    def get_band(self, i):
+        """Returns the i-th band, decoding only its own members.
+        """
+
+        if not 0 <= i < self.n_bands:
+            raise IndexError('band index out of range')
+        offset, length, first_member, n_members, formed, split = \
+            BAND_RECORD.unpack_from(self.__view, self.__bands_start + i * BAND_RECORD.size)
+        members_start = self.__members_start + first_member * MEMBER_INDEX.size
+        members = [self.get_musician(MEMBER_INDEX.unpack_from(self.__view, members_start + j * MEMBER_INDEX.size)[0])
+                   for j in range(n_members)]
+        return Band(self.__get_string(offset, length), *members,
+                    formed=date_int_to_py(formed), split=date_int_to_py(split))
+
+    def musicians(self):
+        """Generator that yields all musicians from the file, one at a time.
+        """
+
+        for i in range(self.n_musicians):
+            yield self.get_musician(i)
+
+    def bands(self):
+        """Generator that yields all bands from the file, one at a time.
+        """
+
+        for i in range(self.n_bands):
+            yield self.get_band(i)
+
+
+def benchmark_binary(n_bands=10_000, n_members=5):
+    """Compares a binary roster file with a JSON file (see music.codec.dumps()) of the same n_bands bands
+    of n_members musicians each. Returns a dict: {<format>: (<file size in bytes>, <time to load everything>,
+    <time to get the name of the last musician, starting from the file>)}, with times in seconds.
+    """
+
+    from music.codec import dumps, loads
+
+    bands = [Band(f'Band {i}', *[Musician(f'Musician {i}-{j}') for j in range(n_members)],
+                  formed=date(1962, 1 + i % 12, 1 + i % 28), split=1970)
+             for i in range(n_bands)]
+    binary_file = write_roster('benchmark_roster.bin', bands=bands)
+    json_file = get_data_file('benchmark_roster.json')
+    json_file.write_text(dumps(bands), encoding='utf-8')
+
+    def load_binary():
+        with RosterFile(binary_file) as roster:
+            return list(roster.bands())
+
+    def last_name_binary():
+        with RosterFile(binary_file) as roster:
+            return roster.get_name(len(roster) - 1)
+
+    def load_json():
+        return loads(json_file.read_text(encoding='utf-8'))
+
+    def last_name_json():
+        return load_json()[-1].members[-1].name
+
+    assert load_binary() == load_json() and last_name_binary() == last_name_json()
+    results = {'binary': (binary_file.stat().st_size, measure_time(load_binary, repeat=3),
+                          measure_time(last_name_binary, repeat=3)),
+               'JSON': (json_file.stat().st_size, measure_time(load_json, repeat=3),
+                        measure_time(last_name_json, repeat=3))}
+    binary_file.unlink()
+    json_file.unlink()
+    return results
+
+
+if __name__ == "__main__":
+
+    from testdata.musicians import *
+
+    # Write a roster file to the data directory and read it back
+    lennon = SingerSongwriter(name='John Lennon', vocals=Vocals.LEAD_VOCALS, instrument=Instrument.RHYTHM_GUITAR)
+    the_beatles = Band('The Beatles', *[lennon, paulMcCartney, georgeHarrison, ringoStarr],
+                       formed=date(1962, 8, 18), split=date(1970, 4, 10))
+    pink_floyd = Band('Pink Floyd', rogerWaters, nickMason, rickWright, davidGilmour, formed=1965, split='unknown')
+    file = write_roster('roster.bin', musicians=[nickCave, bobDylan], bands=[the_beatles, pink_floyd])
+    with RosterFile(file) as roster:
+        print(roster)
+        print(roster.get_name(3))
+        print(roster.get_musician(2))
+        print(roster.get_band(1))
+        raw = roster.get_raw_musician(0)
+        print(bytes(raw))
+        raw.release()
+    file.unlink()
+    print()
+
+    # # Benchmark
+    # for file_format, (size, load_time, access_time) in benchmark_binary().items():
+    #     print(f'{file_format:8}{size:12,} bytes, load all: {load_time:.4f} s, access one: {access_time:.6f} s')
@@ -0,0 +1,316 @@
+"""Persistent catalog of musicians, bands and studios, stored in an SQLite database.
+sqlite3 documentation: https://docs.python.org/3/library/sqlite3.html
+"""
+
+from datetime import date
+import sqlite3
+
+from music.band import Band
+from music.enums import Vocals, Instrument
+from music.musician import SingerSongwriter, KINDS, get_kind_code, create_musician
+from music.studio import Studio
+from util.utility import get_data_file
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS musicians (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    is_band_member INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    vocals TEXT NOT NULL DEFAULT '',
+    instrument TEXT NOT NULL DEFAULT '',
+    UNIQUE (name, is_band_member, kind, vocals, instrument)
+);
+CREATE TABLE IF NOT EXISTS bands (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    formed TEXT NOT NULL,
+    formed_year INTEGER,
+    split TEXT NOT NULL,
+    split_year INTEGER,
+    UNIQUE (name, formed, split)
+);
+CREATE TABLE IF NOT EXISTS band_members (
+    band_id INTEGER NOT NULL REFERENCES bands (id),
+    position INTEGER NOT NULL,
+    musician_id INTEGER NOT NULL REFERENCES musicians (id),
+    PRIMARY KEY (band_id, position)
+);
+CREATE TABLE IF NOT EXISTS studios (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    location TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    UNIQUE (name, location, start_date, end_date)
+);
+CREATE TABLE IF NOT EXISTS studio_bands (
+    studio_id INTEGER NOT NULL REFERENCES studios (id),
+    position INTEGER NOT NULL,
+    band_id INTEGER NOT NULL REFERENCES bands (id),
+    PRIMARY KEY (studio_id, position)
+);
+CREATE INDEX IF NOT EXISTS musicians_name ON musicians (name);
+CREATE INDEX IF NOT EXISTS bands_name ON bands (name);
+CREATE INDEX IF NOT EXISTS bands_formed_year ON bands (formed_year);
+CREATE INDEX IF NOT EXISTS bands_split_year ON bands (split_year);
+CREATE INDEX IF NOT EXISTS band_members_musician ON band_members (musician_id);
+CREATE INDEX IF NOT EXISTS studios_name ON studios (name);
+CREATE INDEX IF NOT EXISTS studios_sessions ON studios (start_date, end_date);
+CREATE INDEX IF NOT EXISTS studio_bands_band ON studio_bands (band_id);
+'''
+
+
+def date_py_to_sql(d):
+    """Converts the formed/split data field of a band to TEXT: an ISO date ('YYYY-mm-dd'), a year ('YYYY'),
+    or '' if it's unknown. Returns a 2-tuple (<TEXT value>, <year, or None if unknown>), the latter for indexing.
+    """
+
+    if isinstance(d, date):
+        return d.isoformat(), d.year
+    if isinstance(d, int):
+        return str(d), d
+    return '', None
+
+
+def date_sql_to_py(s):
+    """Inverse of date_py_to_sql(); unknown dates are returned as 'unknown', as in Band.parse_band_str().
+    """
+
+    return date.fromisoformat(s) if len(s) > 4 else int(s) if s else 'unknown'
+
+
+def musician_py_to_sql(musician):
+    """Returns the row of the musicians table (without the id) that represents musician.
+    Objects of the slotted classes are stored as objects of the corresponding regular classes.
+    """
+
+    vocals = getattr(musician, 'vocals', None)
+    instrument = getattr(musician, 'instrument', None)
+    return (musician.name, bool(musician.is_band_member), KINDS[get_kind_code(musician)].__name__,
+            vocals.name if vocals else '', instrument.name if instrument else '')
+
+
+def musician_sql_to_py(row):
+    """Creates a musician from a (name, is_band_member, kind, vocals, instrument) row of the musicians table.
+    """
+
+    name, is_band_member, kind, vocals, instrument = row
+    return create_musician(next(cls for cls in KINDS if cls.__name__ == kind), name, bool(is_band_member),
+                           Vocals[vocals] if vocals else None, Instrument[instrument] if instrument else None)
+
+
+class Catalog:
+    """The class describing a repository of musicians, bands and studios, persisted in an SQLite database
+    (by default, in the data directory; use file_name=':memory:' for an in-memory database).
+    Adding objects is done in batches, each in one transaction; adding an object that is already in the catalog
+    (e.g., a musician who is a member of several bands) reuses the stored one.
+    Queries are generators that create the domain objects one at a time, as they are iterated over.
+    Use it as a context manager, or call close() when done.
+    """
+
+    def __init__(self, file_name='catalog.db'):
+        self.file = file_name if file_name == ':memory:' else get_data_file(file_name)
+        self.connection = sqlite3.connect(self.file)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __str__(self):
+        counts = [self.connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                  for table in ('musicians', 'bands', 'studios')]
+        return f'Catalog {self.file}: {counts[0]} musicians, {counts[1]} bands, {counts[2]} studios'
+
+    def close(self):
+        self.connection.close()
+
+    def __insert_musicians(self, musicians):
+        """Inserts the musicians that are not in the database yet; returns the list of ids of all of them.
+        """
+
+        rows = [musician_py_to_sql(m) for m in musicians]
+        self.connection.executemany('INSERT OR IGNORE INTO musicians (name, is_band_member, kind, vocals, instrument) '
+                                    'VALUES (?, ?, ?, ?, ?)', dict.fromkeys(rows))
+        ids = {}
+        for row in rows:
+            if row not in ids:
+                ids[row] = self.connection.execute('SELECT id FROM musicians WHERE name = ? AND is_band_member = ? '
+                                                   'AND kind = ? AND vocals = ? AND instrument = ?', row).fetchone()[0]
+        return [ids[row] for row in rows]
+
+    def __insert_bands(self, bands):
+        """Inserts the bands that are not in the database yet, along with their members;
+        returns the list of ids of all of them.
+        """
+
+        ids = []
+        for band in bands:
+            formed, formed_year = date_py_to_sql(band.formed)
+            split, split_year = date_py_to_sql(band.split)
+            cursor = self.connection.execute('INSERT OR IGNORE INTO bands (name, formed, formed_year, split, split_year) '
+                                             'VALUES (?, ?, ?, ?, ?)', (band.name, formed, formed_year, split, split_year))
+            if cursor.rowcount:
+                band_id = cursor.lastrowid
+                self.connection.executemany('INSERT INTO band_members (band_id, position, musician_id) VALUES (?, ?, ?)',
+                                            [(band_id, position, musician_id) for position, musician_id
+                                             in enumerate(self.__insert_musicians(band.members))])
+            else:
+                band_id = self.connection.execute('SELECT id FROM bands WHERE name = ? AND formed = ? AND split = ?',
+                                                  (band.name, formed, split)).fetchone()[0]
+            ids.append(band_id)
+        return ids
+
+    def add_musicians(self, musicians):
+        """Adds musicians to the catalog, in one transaction. Returns the list of their ids.
+        """
+
+        with self.connection:
+            return self.__insert_musicians(musicians)
+
+    def add_bands(self, bands):
+        """Adds bands (and their members) to the catalog, in one transaction. Returns the list of their ids.
+        """
+
+        with self.connection:
+            return self.__insert_bands(bands)
+
+    def add_studios(self, studios):
+        """Adds studios (and their bands and members) to the catalog, in one transaction. Returns the list of their ids.
+        """
+
+        ids = []
+        with self.connection:
+            for studio in studios:
+                row = (studio.name, studio.location, studio.start_date.isoformat(), studio.end_date.isoformat())
+                cursor = self.connection.execute('INSERT OR IGNORE INTO studios (name, location, start_date, end_date) '
+                                                 'VALUES (?, ?, ?, ?)', row)
+                if cursor.rowcount:
+                    studio_id = cursor.lastrowid
+                    self.connection.executemany('INSERT INTO studio_bands (studio_id, position, band_id) '
+                                                'VALUES (?, ?, ?)',
+                                                [(studio_id, position, band_id) for position, band_id
+                                                 in enumerate(self.__insert_bands(studio.bands))])
+                else:
+                    studio_id = self.connection.execute('SELECT id FROM studios WHERE name = ? AND location = ? '
+                                                        'AND start_date = ? AND end_date = ?', row).fetchone()[0]
+                ids.append(studio_id)
+        return ids
+
+    def find_musicians(self, name=None, is_band_member=None, vocals=None, instrument=None):
+        """Generator that yields the musicians that satisfy all of the specified conditions
+        (the conditions left as None are not checked).
+        """
+
+        conditions, parameters = [], []
+        for column, value in (('name', name), ('is_band_member', is_band_member)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                parameters.append(value)
+        for column, value in (('vocals', vocals), ('instrument', instrument)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                parameters.append(value.name)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        for row in self.connection.execute('SELECT name, is_band_member, kind, vocals, instrument FROM musicians'
+                                           + where + ' ORDER BY id', parameters):
+            yield musician_sql_to_py(row)
+
+    def __get_band(self, band_id, name, formed, split):
+        members = [musician_sql_to_py(row) for row in
+                   self.connection.execute('SELECT m.name, m.is_band_member, m.kind, m.vocals, m.instrument '
+                                           'FROM band_members bm JOIN musicians m ON bm.musician_id = m.id '
+                                           'WHERE bm.band_id = ? ORDER BY bm.position', (band_id,))]
+        return Band(name, *members, formed=date_sql_to_py(formed), split=date_sql_to_py(split))
+
+    def find_bands(self, name=None, formed_from=None, formed_to=None, split_from=None, split_to=None,
+                   studio=None, member=None):
+        """Generator that yields the bands that satisfy all of the specified conditions
+        (the conditions left as None are not checked):
+        - formed_from, formed_to, split_from, split_to - years (ints, inclusive)
+        - studio - the name of a studio where the band recorded
+        - member - the name of one of the band members
+        A call example (bands formed between 1962 and 1965 that recorded at Abbey Road):
+            <catalog>.find_bands(formed_from=1962, formed_to=1965, studio='Abbey Road')
+        """
+
+        conditions, parameters = [], []
+        for condition, value in (('b.name = ?', name),
+                                 ('b.formed_year >= ?', formed_from), ('b.formed_year <= ?', formed_to),
+                                 ('b.split_year >= ?', split_from), ('b.split_year <= ?', split_to)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        if studio is not None:
+            conditions.append('b.id IN (SELECT sb.band_id FROM studio_bands sb JOIN studios s ON sb.studio_id = s.id '
+                              'WHERE s.name = ?)')
+            parameters.append(studio)
+        if member is not None:
+            conditions.append('b.id IN (SELECT bm.band_id FROM band_members bm JOIN musicians m '
+                              'ON bm.musician_id = m.id WHERE m.name = ?)')
+            parameters.append(member)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        for row in self.connection.execute('SELECT b.id, b.name, b.formed, b.split FROM bands b'
+                                           + where + ' ORDER BY b.id', parameters):
+            yield self.__get_band(*row)
+
+    def find_studios(self, name=None, sessions_from=None, sessions_to=None):
+        """Generator that yields the studios that satisfy all of the specified conditions
+        (the conditions left as None are not checked). sessions_from and sessions_to are dates;
+        a studio is selected if its recording sessions overlap with the period between them.
+        """
+
+        conditions, parameters = [], []
+        for condition, value in (('name = ?', name),
+                                 ('end_date >= ?', sessions_from.isoformat() if sessions_from else None),
+                                 ('start_date <= ?', sessions_to.isoformat() if sessions_to else None)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        for studio_id, name, location, start_date, end_date in \
+                self.connection.execute('SELECT id, name, location, start_date, end_date FROM studios'
+                                        + where + ' ORDER BY id', parameters):
+            bands = [self.__get_band(*row) for row in
+                     self.connection.execute('SELECT b.id, b.name, b.formed, b.split '
+                                             'FROM studio_bands sb JOIN bands b ON sb.band_id = b.id '
+                                             'WHERE sb.studio_id = ? ORDER BY sb.position', (studio_id,))]
+            s = Studio('', '')                          # as in studio_json_to_py(), the stored data are not validated
+            s.__dict__.update(name=name, location=location, start_date=date.fromisoformat(start_date),
+                              end_date=date.fromisoformat(end_date), bands=tuple(bands))
+            yield s
+
+
+if __name__ == "__main__":
+
+    from testdata.musicians import *
+
+    the_beatles = Band('The Beatles', *[johnLennon, paulMcCartney, georgeHarrison, ringoStarr],
+                       formed=date(1962, 8, 18), split=date(1970, 4, 10))
+    pink_floyd = Band('Pink Floyd', rogerWaters, nickMason, rickWright, davidGilmour,
+                      formed=date(1965, 2, 12), split=date(1995, 3, 14))
+    the_stones = Band('The Rolling Stones', mickJagger, keithRichards, charlieWatts, ronWood,
+                      formed=date(1962, 7, 12), split='unknown')
+    abbey_road = Studio('Abbey Road', 'London', *[the_beatles, pink_floyd],
+                        start_date=date(1967, 1, 1), end_date=date(1967, 12, 31), )
+    olympic = Studio('Olympic', 'London', the_stones, start_date=date(1966, 1, 1), end_date=date(1969, 12, 31))
+
+    with Catalog(':memory:') as catalog:
+        catalog.add_studios([abbey_road, olympic])
+        catalog.add_musicians([nickCave, bobDylan,
+                               SingerSongwriter(name='Taylor Swift', is_band_member=False,
+                                                vocals=Vocals.LEAD_VOCALS, instrument=Instrument.RHYTHM_GUITAR)])
+        print(catalog)
+        print()
+
+        for band in catalog.find_bands(formed_from=1962, formed_to=1965, studio='Abbey Road'):
+            print(band, '\n')
+        for musician in catalog.find_musicians(is_band_member=False):
+            print(musician)
+        print()
+        for studio in catalog.find_studios(sessions_from=date(1969, 6, 1)):
+            print(studio)
+        print()
@@ -0,0 +1,421 @@
+"""Single-pass JSON encoding/decoding of Studio, Band and Musician objects (and objects of Musician subclasses).
+Unlike studio_py_to_json() and band_py_to_json(), which store the JSON strings of bands and members
+as (escaped) strings inside the outer document, the functions in this module produce one properly nested document,
+encoded in one json.dumps() call and decoded in one json.loads() call.
+The encoders and decoders of all types are kept in a codec registry, keyed by class and by type tag.
+"""
+
+from datetime import date
+import json
+
+from music.enums import Vocals, Instrument
+from music.musician import Musician, SlottedMusician, Singer, Songwriter, SingerSongwriter, \
+    musician_py_to_json, musician_json_to_py, musician_fields_py_to_json, ENUM_FIELDS, enum_json_to_py, \
+    SLOTTED_MUSICIAN_TAGS, slotted_musician_py_to_json, slotted_musician_json_to_py
+from music.band import Band, band_py_to_json, band_json_to_py
+from music.studio import Studio, studio_py_to_json, studio_json_to_py
+from util.utility import get_data_file, measure_time
+
+
+def date_or_year_json_to_py(value):
+    """Converts a string formatted as 'YYYY-mm-dd' to datetime.date object; returns any other value unchanged
+    (bands can be formed/split in a year (int), or at an unknown date).
+    """
+
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+# Codec registry: type tag -> decoder function (dict of fields -> object),
+# class -> (type tag, encoder function (object -> dict of fields)); see register_codec()
+DECODERS = {}
+ENCODERS = {}
+
+
+def register_codec(cls, encoder, decoder, tag=None):
+    """Registers the encoder and the decoder function of cls under the type tag (by default, '__<class name>__').
+    Subclasses of cls that are not registered themselves are encoded with the encoder of cls (and under its tag).
+    """
+
+    tag = tag if tag else f'__{cls.__name__}__'
+    ENCODERS[cls] = (tag, encoder)
+    DECODERS[tag] = decoder
+
+
+def get_encoder(cls):
+    """Returns the (type tag, encoder function) pair of cls or of its closest registered superclass,
+    or None if there is no such class.
+    """
+
+    for c in cls.__mro__:
+        if c in ENCODERS:
+            ENCODERS[cls] = ENCODERS[c]                         # next time, found in one lookup
+            return ENCODERS[c]
+    return None
+
+
+def band_fields_py_to_json(band):
+    """Returns the dict of the data fields of a Band object; members are kept as Musician objects,
+    so json.dumps() encodes them in the same document.
+    """
+
+    return {"name": band.name, "members": list(band.members), "formed": band.formed, "split": band.split}
+
+
+def band_fields_json_to_py(fields):
+    """Creates a Band object from the dict of its data fields (members are already decoded).
+    Members stored as a JSON string, as in band_py_to_json(), are decoded here.
+    """
+
+    members = fields['members']
+    if isinstance(members, str):                                    # band_py_to_json() format
+        members = MUSIC_DECODER.decode(members)
+    return Band(fields['name'], *members,
+                formed=date_or_year_json_to_py(fields['formed']), split=date_or_year_json_to_py(fields['split']))
+
+
+def studio_fields_py_to_json(studio):
+    """Returns the dict of the data fields of a Studio object; bands are kept as Band objects,
+    so json.dumps() encodes them in the same document.
+    """
+
+    return {"name": studio.name, "location": studio.location,
+            "start_date": studio.start_date, "end_date": studio.end_date, "bands": list(studio.bands)}
+
+
+def studio_fields_json_to_py(fields):
+    """Creates a Studio object from the dict of its data fields (bands are already decoded).
+    Bands stored as a JSON string, as in studio_py_to_json(), are decoded here.
+    """
+
+    bands = fields['bands']
+    if isinstance(bands, str):                                      # studio_py_to_json() format
+        bands = MUSIC_DECODER.decode(bands)
+    s = Studio('', '')                              # as in studio_json_to_py(), the recorded data are not validated
+    s.__dict__.update(name=fields['name'],
+                      location=fields['location'],
+                      start_date=date_or_year_json_to_py(fields['start_date']),
+                      end_date=date_or_year_json_to_py(fields['end_date']),
+                      bands=tuple(bands))
+    return s
+
+
+def musician_decoder(cls):
+    """Returns the decoder function of cls (Musician or one of its subclasses) for the codec registry:
+    musician_fields_json_to_py() specialized for cls, with the enum fields of cls looked up once, here.
+    Objects of the classes without enum fields (e.g., plain Musician objects, the most common ones)
+    are decoded without the enum pass.
+    """
+
+    enum_fields = tuple((field, enum) for field, enum in ENUM_FIELDS.items() if field in cls.pickle_fields)
+    new = cls.__new__
+
+    if not enum_fields:
+        def decode(fields):
+            m = new(cls)
+            m.__dict__.update(fields)
+            return m
+        return decode
+
+    def decode_with_enums(fields):
+        m = new(cls)
+        d = m.__dict__
+        d.update(fields)
+        for field, enum in enum_fields:
+            if field in fields:
+                d[field] = enum_json_to_py(enum, fields[field])
+        return m
+    return decode_with_enums
+
+
+for musician_class in (Musician, Singer, Songwriter, SingerSongwriter):
+    register_codec(musician_class, musician_fields_py_to_json, musician_decoder(musician_class))
+for slotted_class in SLOTTED_MUSICIAN_TAGS.values():
+    register_codec(slotted_class, slotted_musician_py_to_json,
+                   lambda fields, cls=slotted_class: slotted_musician_json_to_py(cls, fields))
+register_codec(Band, band_fields_py_to_json, band_fields_json_to_py)
+register_codec(Studio, studio_fields_py_to_json, studio_fields_json_to_py)
+
+
+class MusicEncoder(json.JSONEncoder):
+    """JSON encoder for Studio, Band and Musician objects (cls= parameter in json.dumps()).
+    """
+
+    def default(self, o):
+        return music_py_to_json(o)
+
+
+def music_py_to_json(o):
+    """JSON encoder for Studio, Band and Musician objects, and objects of the subclasses of Musician
+    (default= parameter in json.dumps()). The encoder is picked from the codec registry by the class of o.
+    Bands and members are returned as Python objects, not as JSON strings,
+    so json.dumps() calls this function again for each of them and nests them in the same document.
+    """
+
+    encoder = ENCODERS.get(type(o)) or get_encoder(type(o))
+    if encoder:
+        tag, encode = encoder
+        return {tag: encode(o)}
+    if isinstance(o, date):
+        return o.isoformat()
+    raise TypeError(f'Object of type {o.__class__.__name__} is not JSON serializable')
+
+
+def music_json_to_py(music_json):
+    """JSON decoder for Studio, Band and Musician objects, and objects of the subclasses of Musician
+    (object_hook= parameter in json.loads()). A single dict lookup of the type tag in the codec registry
+    picks the decoder, instead of probing the dict for the type tags one by one.
+    json.loads() calls the object hook bottom-up, so members are already decoded when their band is decoded,
+    and bands are already decoded when their studio is decoded.
+    Also reads the format of studio_py_to_json() and band_py_to_json(), where bands and members are JSON strings.
+    """
+
+    if len(music_json) == 1:
+        (tag, fields), = music_json.items()
+        decode = DECODERS.get(tag)
+        if decode:
+            return decode(fields)
+    return music_json
+
+
+# A reusable decoder with music_json_to_py() as the object hook; json.loads(s, object_hook=...) creates a new
+# JSONDecoder on each call, which adds up for the member lists (and band lists) nested in the document as JSON strings
+MUSIC_DECODER = json.JSONDecoder(object_hook=music_json_to_py)
+
+
+def dumps(o, **kwargs):
+    """Returns the JSON string of o (a Studio, Band or Musician object, or a list/dict of them).
+    The kwargs (e.g., indent=4) are passed to json.dumps().
+    """
+
+    return json.dumps(o, default=music_py_to_json, **kwargs)
+
+
+def loads(s):
+    """Returns the Python object(s) decoded from a JSON string created by dumps() (or by studio_py_to_json(),
+    band_py_to_json() and musician_py_to_json()).
+    """
+
+    return MUSIC_DECODER.decode(s)
+
+
+def dumps_shared(o, by_value=False, **kwargs):
+    """Returns the JSON string of o (as in dumps()), with each musician stored only once, in a table of musicians,
+    and referred to by its index in the table ({"__MusicianRef__": <index>}) wherever it appears
+    (e.g., a session player who is a member of many bands). The document has the form:
+        {"__Shared__": {"musicians": [<musician>, ...], "root": <o, with musicians replaced by references>}}
+    Musicians are the same if they are the same object, or, if by_value is True, if they are equal
+    (i.e., have the same JSON representation). The kwargs (e.g., indent=4) are passed to json.dumps().
+    """
+
+    indices = {}
+    musicians = []
+
+    def shared_py_to_json(x):
+        if isinstance(x, (Musician, SlottedMusician)):
+            key = json.dumps(x, default=music_py_to_json) if by_value else id(x)
+            i = indices.get(key)
+            if i is None:
+                i = indices[key] = len(musicians)
+                musicians.append(x)                     # also keeps x alive, so that id(x) is not reused
+            return {"__MusicianRef__": i}
+        return music_py_to_json(x)
+
+    root = json.dumps(o, default=shared_py_to_json, **kwargs)
+    table = json.dumps(musicians, default=music_py_to_json, **kwargs)
+    return f'{{"__Shared__": {{"musicians": {table}, "root": {root}}}}}'
+
+
+def loads_shared(s):
+    """Returns the Python object(s) decoded from a JSON string created by dumps_shared().
+    Each musician from the table of musicians is decoded once, and all references to it are resolved
+    to the same object (an identity map), so there are as many Musician objects in memory as there are
+    distinct musicians. It takes one json.loads() call, since the table precedes the references in the document.
+    """
+
+    musicians = []
+
+    def shared_json_to_py(d):
+        if len(d) == 1:
+            tag, fields = next(iter(d.items()))
+            if tag == "__MusicianRef__":
+                return musicians[fields]
+            if tag == "__Shared__":
+                return fields['root']
+            o = music_json_to_py(d)
+            if isinstance(o, (Musician, SlottedMusician)):
+                musicians.append(o)
+            return o
+        return d
+
+    return json.loads(s, object_hook=shared_json_to_py)
+
+
+def benchmark_shared(n_bands=1000, n_members=5, n_session_players=20):
+    """Compares dumps()/loads() with dumps_shared()/loads_shared() on a generated studio of n_bands bands,
+    whose members are all taken from a pool of n_session_players musicians.
+    Returns a dict: {<encoding>: (<payload size in bytes>, <number of distinct Musician objects after loading>)}.
+    """
+
+    players = [Musician(f'Session player {i}') for i in range(n_session_players)]
+    studio = generate_studio(n_bands, n_members)
+    for i, band in enumerate(studio.bands):
+        band.members = tuple(players[(i + j) % n_session_players] for j in range(n_members))
+
+    def count_musicians(loaded):
+        return len({id(m) for band in loaded.bands for m in band.members})
+
+    inline, shared = dumps(studio), dumps_shared(studio)
+    return {'inline': (len(inline), count_musicians(loads(inline))),
+            'shared': (len(shared), count_musicians(loads_shared(shared)))}
+
+
+def write_jsonl(objects, file_name, append=False):
+    """Writes Studio, Band and Musician objects from the iterable objects to a JSON Lines file,
+    one JSON document (see dumps()) per line. Returns the number of objects written.
+    The objects are written one at a time, so objects can be a generator producing any number of them
+    without keeping them all in memory.
+    """
+
+    n = 0
+    with open(get_data_file(file_name), 'a' if append else 'w', encoding='utf-8') as f:
+        for o in objects:
+            f.write(dumps(o))
+            f.write('\n')
+            n += 1
+    return n
+
+
+def read_jsonl(file_name):
+    """Generator that reads a JSON Lines file written by write_jsonl() and yields the decoded objects
+    one at a time (blank lines are skipped).
+    """
+
+    with open(get_data_file(file_name), 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def generate_studio(n_bands=100, n_members=5):
+    """Generates a Studio object with n_bands bands of n_members musicians each, for testing and benchmarking.
+    """
+
+    bands = [Band(f'Band {i}', *[Musician(f'Musician {i}-{j}') for j in range(n_members)],
+                  formed=date(1962, 1 + i % 12, 1 + i % 28), split=date(1970, 4, 10))
+             for i in range(n_bands)]
+    return Studio('Abbey Road', 'London', *bands, start_date=date(1962, 1, 1), end_date=date(1970, 12, 31))
+
+
+def benchmark_codec(n_bands=1000, n_members=5):
+    """Compares studio_py_to_json()/studio_json_to_py() with dumps()/loads() on a generated studio.
+    Returns a dict: {<codec>: (<payload size in bytes>, <round-trip time in seconds>)}.
+    """
+
+    studio = generate_studio(n_bands, n_members)
+
+    def nested_round_trip():
+        return json.loads(json.dumps(studio, default=studio_py_to_json), object_hook=studio_json_to_py)
+
+    def flat_round_trip():
+        return loads(dumps(studio))
+
+    return {'nested strings': (len(json.dumps(studio, default=studio_py_to_json).encode()),
+                               measure_time(nested_round_trip, repeat=3)),
+            'single document': (len(dumps(studio).encode()), measure_time(flat_round_trip, repeat=3))}
+
+
+def chained_json_to_py(music_json):
+    """Decodes any mix of Musician, Band and Studio objects by chaining musician_json_to_py(), band_json_to_py()
+    and studio_json_to_py() (object_hook= parameter in json.loads()); used as the baseline in benchmark_registry().
+    """
+
+    for hook in (musician_json_to_py, band_json_to_py, studio_json_to_py):
+        o = hook(music_json)
+        if o is not music_json:
+            return o
+    return music_json
+
+
+def benchmark_registry(n=10_000):
+    """Compares decoding a mixed document (a list of n Musician objects, n Band objects and n/100 Studio objects)
+    with chained_json_to_py() and with music_json_to_py() (through MUSIC_DECODER, as in loads()).
+    Both decode the same document, in the format of musician_py_to_json(), band_py_to_json() and studio_py_to_json(),
+    since it's the only one the chained hooks can decode (see benchmark_codec() for the single-document format).
+    Returns a dict: {<decoder>: <decoding time in seconds>}.
+    """
+
+    def mixed_py_to_json(o):
+        return studio_py_to_json(o) if isinstance(o, Studio) else \
+            band_py_to_json(o) if isinstance(o, Band) else \
+            musician_py_to_json(o)
+
+    studio = generate_studio(n_bands=10, n_members=4)
+    mixed = [Musician(f'Musician {i}') for i in range(n)] + list(generate_studio(n, 4).bands) + [studio] * (n // 100)
+    mixed_json = json.dumps(mixed, default=mixed_py_to_json)
+    assert json.loads(mixed_json, object_hook=chained_json_to_py) == loads(mixed_json)
+    return {'chained hooks': measure_time(json.loads, mixed_json, object_hook=chained_json_to_py, repeat=5),
+            'codec registry': measure_time(loads, mixed_json, repeat=5)}
+
+
+if __name__ == "__main__":
+
+    from testdata.musicians import *
+
+    # Encode/decode a Studio object as a single JSON document
+    the_beatles = Band('The Beatles', *[johnLennon, paulMcCartney, georgeHarrison, ringoStarr],
+                       formed=date(1962, 8, 18), split=date(1970, 4, 10))
+    pink_floyd = Band('Pink Floyd', rogerWaters, nickMason, rickWright, davidGilmour,
+                      formed=date(1965, 2, 12), split=date(1995, 3, 14))
+    abbey_road = Studio('Abbey Road', 'London', *[the_beatles, pink_floyd],
+                        start_date=date(1967, 1, 1), end_date=date(1967, 12, 31), )
+    abbey_road_json = dumps(abbey_road, indent=4)
+    print(abbey_road_json)
+    abbey_road_py = loads(abbey_road_json)
+    print(abbey_road_py)
+    print(abbey_road_py.bands[1])
+    print()
+
+    # Years (ints) are kept as they are, not converted to 'null' as in band_py_to_json()
+    the_stones = Band('The Rolling Stones', mickJagger, keithRichards, charlieWatts, ronWood, formed=1962, split=None)
+    print(loads(dumps(the_stones)))
+    print()
+
+    # Read the nested-strings format of studio_py_to_json()
+    print(loads(json.dumps(abbey_road, default=studio_py_to_json)).bands[0])
+    print()
+
+    # Musicians shared by several bands are stored once
+    the_bootlegs = Band('The Bootlegs', johnLennon, mickJagger, rogerWaters, formed=1975, split=1976)
+    catalog_json = dumps_shared([the_beatles, the_bootlegs], indent=4)
+    print(catalog_json)
+    the_beatles_py, the_bootlegs_py = loads_shared(catalog_json)
+    print(the_beatles_py.members[0] is the_bootlegs_py.members[0])
+    print()
+
+    # # Stream objects to/from a JSON Lines file in the data directory
+    # n = write_jsonl((Musician(f'Musician {i}', is_band_member=i % 2 == 0) for i in range(1_000_000)),
+    #                 'musicians.jsonl')
+    # print(n)
+    # print(sum(1 for m in read_jsonl('musicians.jsonl') if not m.is_band_member))
+    # write_jsonl([the_beatles, pink_floyd, abbey_road], 'catalog.jsonl')
+    # for o in read_jsonl('catalog.jsonl'):
+    #     print(o, '\n')
+    # print()
+
+    # Any mix of types in one document, decoded by one object hook
+    lennon = SingerSongwriter(name='John Lennon', vocals=Vocals.LEAD_VOCALS, instrument=Instrument.RHYTHM_GUITAR)
+    for o in loads(dumps([lennon, nickCave, the_beatles, abbey_road])):
+        print(o, '\n')
+
+    # # Benchmarks
+    # for decoder, seconds in benchmark_registry().items():
+    #     print(f'{decoder:35}{seconds:10.4f} s')
+    # for codec, (size, seconds) in benchmark_codec().items():
+    #     print(f'{codec:20}{size:12,} bytes{seconds:10.4f} s')
+    # for encoding, (size, n_musicians) in benchmark_shared().items():
+    #     print(f'{encoding:10}{size:12,} bytes{n_musicians:10,} musicians in memory')
@@ -2,28 +2,197 @@
 BeautifulSoup documentation: https://www.crummy.com/software/BeautifulSoup/bs4/doc/
 """
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import closing, contextmanager
+from html.parser import HTMLParser
+from itertools import islice
+import json
+from multiprocessing import get_context
+import os
+import re
+from threading import Lock
+import time
+
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
 
+from music.httpcache import CachingAdapter, ResponseCache
+from music.instrument import CrawlStats
+from music.ratelimit import RateLimitedAdapter, CachingRateLimitedAdapter, RateLimiter
+from music.standin import StandInServer
 from util import utility
 
 BASE_URL = 'https://www.imdb.com/'
 
+# The first 4 consecutive digits in a string (see get_4_digit_substring()), and the same for each line of a text
+YEAR_PATTERN = re.compile(r'\d{4}')
+LINE_YEAR_PATTERN = re.compile(r'^[^\n]*?(\d{4})|^', re.MULTILINE)
+
+
+# HTTP request headers sent with each request through the shared session
+SESSION_HEADERS = {'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'}
+
+shared_session = None                           # see get_session()
+session_lock = Lock()                           # guards the creation and replacement of shared_session
+
+# Parsers that BeautifulSoup can use, fastest first; lxml is optional (pip install lxml)
+FAST_PARSERS = ('lxml', 'html.parser')
+
+soup_parser = 'html.parser'                     # see configure_parser()
+
+crawl_stats = None                              # see instrumented()
+
+# The only parts of a movie list page that get_m_info() needs: the h3 tags with movie titles and the poster divs
+# (paired by their order in the page; see pair_m_info())
+MOVIE_ITEMS = SoupStrainer(class_=['lister-item-header', 'lister-item-image ribbonize'])
+
+
+def create_session(pool_maxsize=16, headers=None, cache=None, limiter=None):
+    """Returns a new requests.Session object with connection pooling and keep-alive (connections to a host are
+    kept open and reused by subsequent requests), negotiating compressed responses (gzip, deflate).
+    Parameters:
+    - pool_maxsize: the max number of connections kept open per host; should be at least max_in_flight in crawl()
+    - headers: additional HTTP request headers (e.g., {'User-Agent': ...})
+    - cache: a music.httpcache.ResponseCache object; if given, responses are cached on disk and revalidated
+      with conditional requests (e.g., create_session(cache=ResponseCache()))
+    - limiter: a music.ratelimit.RateLimiter object; if given, requests are paced per host, adapting to the
+      server's responses, and throttled requests (429/5xx) are retried (e.g., create_session(limiter=RateLimiter()))
+    """
+
+    new_session = requests.Session()
+    if cache is not None and limiter is not None:
+        adapter = CachingRateLimitedAdapter(cache, limiter, pool_maxsize=pool_maxsize)
+    elif cache is not None:
+        adapter = CachingAdapter(cache, pool_maxsize=pool_maxsize)
+    elif limiter is not None:
+        adapter = RateLimitedAdapter(limiter, pool_maxsize=pool_maxsize)
+    else:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize)
+    new_session.mount('http://', adapter)
+    new_session.mount('https://', adapter)
+    new_session.headers.update(SESSION_HEADERS)
+    new_session.headers.update(headers if headers else {})
+    return new_session
+
+
+def get_session():
+    """Returns the shared session used by get_soup(), get_next_soup(), crawl() and get_m_info()
+    unless they are called with another session; it is created by create_session() on first use.
+    The session can be shared between threads (e.g., in crawl() with max_in_flight > 1),
+    since its connection pool is thread-safe.
+    """
+
+    global shared_session
+    if shared_session is None:
+        with session_lock:
+            if shared_session is None:                  # not created by another thread meanwhile
+                shared_session = create_session()
+    return shared_session
+
+
+def configure_session(pool_maxsize=16, headers=None, cache=None, limiter=None):
+    """Replaces the shared session with a new one (see create_session() for the parameters) and returns it.
+    """
+
+    global shared_session
+    with session_lock:
+        if shared_session is not None:
+            shared_session.close()
+        shared_session = create_session(pool_maxsize, headers, cache, limiter)
+        return shared_session
+
+
+def create_replay_session(fixture_dir='fixtures', record=False, pool_maxsize=16):
+    """Returns a new session (see create_session()) that replays the pages stored in fixture_dir
+    (a music.httpcache.ResponseCache directory; relative paths are located in the data directory)
+    without network access; requests for pages that are not in fixture_dir raise requests.ConnectionError.
+    If record is True, the pages that are not in fixture_dir yet are fetched and stored there instead,
+    so a crawl through a recording session creates the fixtures for replaying it:
+        get_m_info(start_url, max_pages=5, session=create_replay_session(record=True))   # once, online
+        get_m_info(start_url, max_pages=5, session=create_replay_session())              # then offline
+    """
+
+    fixtures = ResponseCache(fixture_dir, max_size=float('inf'), max_age=float('inf'), offline=not record)
+    return create_session(pool_maxsize, cache=fixtures)
+
+
+@contextmanager
+def instrumented(stats=None):
+    """Context manager that records the statistics of the crawls (fetch latency, response size, parse,
+    wait and extraction times of each page; see music.instrument) into stats (by default, a new CrawlStats object)
+    while it is active, and yields stats:
+        with instrumented() as stats:
+            get_m_info(start_url, max_pages=10)
+        print(stats)
+        stats.write_report('crawl_report.json')
+    """
+
+    global crawl_stats
+    previous_stats, crawl_stats = crawl_stats, stats if stats else CrawlStats()
+    try:
+        yield crawl_stats
+    finally:
+        crawl_stats.stop()
+        crawl_stats = previous_stats
+
+
+def get_available_parsers(parsers=FAST_PARSERS):
+    """Returns the tuple of those parsers (parser names, e.g. 'lxml') that are installed and usable by BeautifulSoup.
+    """
+
+    return tuple(parser for parser in parsers if builder_registry.lookup(parser))
+
+
+def configure_parser(parsers=FAST_PARSERS):
+    """Sets the parser used by get_soup() to the first installed parser from parsers and returns its name
+    (e.g., configure_parser() selects lxml if it is installed, and 'html.parser' otherwise).
+    """
+
+    global soup_parser
+    available = get_available_parsers(parsers)
+    if not available:
+        raise ValueError(f'None of the parsers {parsers} is installed')
+    soup_parser = available[0]
+    return soup_parser
 
-def get_soup(url: str) -> BeautifulSoup:
+
+def get_page(url: str, session=None) -> str:
+    """Returns the text of the page at the URL, fetched by HTTP GET request through session
+    (by default, the shared session; see get_session()); no redirection is allowed (allow_redirects=False).
+    Raises requests.HTTPError for error responses (e.g., 429 Too Many Requests when throttled, after the retries
+    of a session with a RateLimiter), rather than returning the text of an error page.
+    """
+
+    start = time.perf_counter()
+    response = (session if session else get_session()).get(url, allow_redirects=False)
+    response.raise_for_status()
+    if crawl_stats is not None:
+        crawl_stats.record('fetch', time.perf_counter() - start, url)
+        crawl_stats.record('bytes', len(response.content), url)
+    return response.text
+
+
+def get_soup(url: str, session=None, parse_only=None) -> BeautifulSoup:
     """Returns BeautifulSoup object from the corresponding URL, passed as a string.
-    Creates Response object from HTTP GET request, using requests.get(<url string>, allow_redirects=False),
-    and then uses the text field of the Response object and the 'html.parser' to create the BeautifulSoup object.
+    Creates Response object from HTTP GET request, using <session>.get(<url string>, allow_redirects=False)
+    through session (by default, the shared session; see get_session()),
+    and then uses the text field of the Response object and the 'html.parser' (or another parser,
+    see configure_parser()) to create the BeautifulSoup object.
+    If parse_only is a SoupStrainer (e.g., MOVIE_ITEMS), only the matching tags (and their subtrees) are built.
     """
 
     # Create Response object from HTTP GET request; assume that no redirection is allowed (allow_redirects=False)
-    response = requests.get(url, allow_redirects=False)
-
     # Get text from the Response object, using <response>.text
-    response_text = response.text
+    response_text = get_page(url, session)
 
     # Create and return the corresponding BeautifulSoup object from the response text; use 'html.parser'
-    return BeautifulSoup(response_text, 'html.parser')
+    start = time.perf_counter()
+    soup = BeautifulSoup(response_text, soup_parser, parse_only=parse_only)
+    if crawl_stats is not None:
+        crawl_stats.record('parse', time.perf_counter() - start, url)
+    return soup
 
 
 def get_specific_page(start_url: str, page=1):
@@ -38,93 +207,662 @@ def get_specific_page(start_url: str, page=1):
         return start_url
 
 
-def get_next_soup(start_url: str, page=1):
+def get_next_soup(start_url: str, page=1, session=None, parse_only=None):
     """Returns the BeautifulSoup object corresponding to a specific page
     in case there are multiple pages that list objects of interest.
     Parameters:
     - start_url: the starting page/url of a multi-page list of objects
     - page: the page number of a specific page of a multi-page list of objects
+    - session: the session to fetch the page through (by default, the shared session; see get_session())
+    - parse_only: a SoupStrainer for a targeted parse of the page (see get_soup())
     """
 
-    return get_soup(get_specific_page(start_url, page))
+    return get_soup(get_specific_page(start_url, page), session, parse_only)
 
 
-def crawl(url: str, max_pages=1):
+def crawl(url: str, max_pages=1, max_in_flight=1, session=None, parse_only=None, first_page=1):
     """Web crawler that collects info about movies from IMDb,
     implemented as a Python generator that yields BeautifulSoup objects (get_next_soup()) from multi-page movie lists.
     Parameters: the url of the starting IMDb page and the max number of pages to crawl in case of multi-page lists.
+    If max_in_flight > 1, up to max_in_flight pages are fetched concurrently (in a thread pool),
+    but the pages are still yielded in page order.
+    All pages are fetched through session (by default, the shared session; see get_session()),
+    so connections are reused from page to page.
+    If parse_only is a SoupStrainer, only the matching parts of the pages are parsed (see get_soup()).
+    If first_page > 1, the crawl starts from that page (e.g., to resume an interrupted crawl) and ends at max_pages.
     """
 
-    for page in range(max_pages):
-        yield get_next_soup(url, page + 1)
-        page += 1
+    if max_in_flight <= 1:
+        for page in range(first_page - 1, max_pages):
+            start = time.perf_counter()
+            soup = get_next_soup(url, page + 1, session, parse_only)
+            if crawl_stats is not None:
+                crawl_stats.record('wait', time.perf_counter() - start, get_specific_page(url, page + 1))
+            yield soup
+            page += 1
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    try:
+        pages = iter(range(first_page, max_pages + 1))
+        in_flight = deque((page, executor.submit(get_next_soup, url, page, session, parse_only))
+                          for page in islice(pages, max_in_flight))
+        while in_flight:
+            start = time.perf_counter()
+            page, future = in_flight.popleft()
+            soup = future.result()
+            if crawl_stats is not None:
+                crawl_stats.record('wait', time.perf_counter() - start, get_specific_page(url, page))
+            for next_page in islice(pages, 1):              # keep max_in_flight pages in flight while soup is used
+                in_flight.append((next_page, executor.submit(get_next_soup, url, next_page, session, parse_only)))
+            yield soup
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)  # e.g., when the generator is closed before the last page
 
 
 def get_4_digit_substring(a_string):
     """Returns the first 4-digit substring from a_string.
     It assumes that a_string contains a 4-digit substring representing a year.
-    Useful when the year of a movie release on IMDb is represented like '(1988, part 2)', or '(video, 2002)'."""
+    Useful when the year of a movie release on IMDb is represented like '(1988, part 2)', or '(video, 2002)'.
+    Scans a_string just once, with a precompiled regex (YEAR_PATTERN); returns None if there is no 4-digit substring."""
 
-    if len(a_string) >=4:
-        # all_4_digit_substrings = [a_string[i:j]
-        #                           for i in range(0, len(a_string) - 3)
-        #                           for j in range(i + 1, len(a_string) + 1)
-        #                           if len(a_string[i:j]) == 4]
-        all_4_digit_substrings = [a_string[i:(i+4)] for i in range(0, len(a_string) - 3)]
-        first_4_digit_substring = next((x for x in all_4_digit_substrings if x.isdigit()), None)
-        return first_4_digit_substring
-    else:
-        return None
+    # if len(a_string) >=4:
+    #     all_4_digit_substrings = [a_string[i:(i+4)] for i in range(0, len(a_string) - 3)]
+    #     first_4_digit_substring = next((x for x in all_4_digit_substrings if x.isdigit()), None)
+    #     return first_4_digit_substring
+    # else:
+    #     return None
+    match = YEAR_PATTERN.search(a_string)
+    return match.group() if match else None
 
 
-def get_m_info(start_url: str, max_pages=1):
+def get_years(year_strings, default=None):
+    """Returns the list of the first 4-digit substrings (see get_4_digit_substring()) of all strings in year_strings
+    (e.g., a column of raw years of movies, like '(1988, part 2)' or '(video, 2002)'), or default for the strings
+    that have none. The strings are joined into one text that is scanned once, with one regex match per line
+    (LINE_YEAR_PATTERN); if a string contains a newline, the strings are scanned one by one instead.
+    """
+
+    year_strings = list(year_strings)
+    text = '\n'.join(year_strings)
+    if not year_strings or text.count('\n') != len(year_strings) - 1:
+        search = YEAR_PATTERN.search
+        return [match.group() if (match := search(a_string)) else default for a_string in year_strings]
+    return [year if year else default for year in LINE_YEAR_PATTERN.findall(text)]
+
+
+def get_m_info(start_url: str, max_pages=1, max_in_flight=1, session=None, targeted=False):
     """
     Returns structured information about movies from a multi-page IMDb movie list.
     :param start_url: the url of the starting page of a multi-page IMDb movie list
     :param max_pages: the max number of pages to crawl
-    :return: a list of tuples of info-items about the movies from a multi-page IMDb movie list
-    Creates and uses the following data:
-    - h3_list - a list of all 'h3' tags from multiple IMDb pages
-                (each 'h3' tag contains: movie title, year of release, and (relative) link to the movie's IMDb page)
-    - poster_list - a list of all relevant 'div' tags from multiple IMDb pages
-                    (each such a 'div' tag contains the link to the poster of the corresponding movie)
-    - info_list - a list of 3-tuples of information about each movie from h3_list
-    - poster_link_list - a list of links to the posters of the movies from poster_list
-    - complete_list - a list of 4-tuples of information about each movie from h3_list and poster_list
-    """
-
-    h3_list = []
-    poster_list = []
-    next_soup = crawl(start_url, max_pages)
-    while True:
-        try:
-            s = next(next_soup)
-            h3_list.extend(s.find_all('h3')[:-1])
-            poster_list.extend(s.find_all('div', {'class': "lister-item-image ribbonize"}))
-        except StopIteration:
-            break
-
-    info_list = []
-    for h3 in h3_list:
-        title = h3.a.text.strip()                               # some titles contain leading/trailing whitespace
-        # year = h3.find('span', {'class': "lister-item-year text-muted unbold"}).text.split()[-1].lstrip('(').rstrip(')')
-        year = h3.find('span', {'class': "lister-item-year text-muted unbold"}).text
-        year = get_4_digit_substring(year)
-        year = 'unknown' if not year else year      # covers the case when get_4_digit_substring(year) returns None
-        link = BASE_URL + h3.a['href'].lstrip('/')
-        info_list.append((title, year, link))
-
-    poster_link_list = []
-    for poster in poster_list:
-        poster_link = poster.a.img['loadlate']
-        poster_link_list.append(poster_link)
-
-    complete_list = []
-    for info, poster_link in zip(info_list, poster_link_list):
-        title, year, link = info
-        complete_list.append((title, year, link, poster_link))
-
-    return complete_list
+    :param max_in_flight: the max number of pages fetched concurrently (see crawl())
+    :param session: the session to fetch the pages through (by default, the shared session; see get_session())
+    :param targeted: if True, only the h3 tags and the poster divs are parsed from the pages (see MOVIE_ITEMS)
+    :return: a list of 4-tuples (title, year, link, poster link) of the movies from a multi-page IMDb movie list
+    The movies of each page are extracted by get_page_m_info(), which takes all four info-items of a movie
+    from the same 'lister-item' div (see extract_m_info() and pair_m_info()), so a movie without a poster
+    gets None as its poster link, rather than the poster of another movie.
+    """
+
+    return list(iter_m_info(start_url, max_pages, max_in_flight, session, targeted))
+
+
+def get_item_m_info(item):
+    """Returns the 4-tuple (title, year, link, poster link) of the movie from a 'lister-item' div of an IMDb movie list,
+    or None if the item has no title. The poster link is None if the item has no poster.
+    Only the item's direct children and the title's h3 tag are visited, not the whole subtree of the item.
+    """
+
+    content = item.find('div', {'class': "lister-item-content"}, recursive=False)
+    h3 = content.find('h3', recursive=False) if content else None
+    if not h3 or not h3.a:
+        return None
+    year_span = h3.find('span', {'class': "lister-item-year"}, recursive=False)
+    year = get_4_digit_substring(year_span.text) if year_span else None
+    image = item.find('div', {'class': "lister-item-image"}, recursive=False)
+    poster_link = image.a.img.get('loadlate') if image and image.a and image.a.img else None
+    return h3.a.text.strip(), year if year else 'unknown', BASE_URL + h3.a['href'].lstrip('/'), poster_link
+
+
+def extract_m_info(soup: BeautifulSoup):
+    """Returns the list of 4-tuples (title, year, link, poster link) of the movies from one page of an IMDb movie list,
+    walking the tree once and taking all four info-items from the same 'lister-item' div (see get_item_m_info()),
+    so a movie without a poster gets None rather than the poster of another movie.
+    """
+
+    return [info for info in map(get_item_m_info, soup.find_all('div', {'class': "lister-item"})) if info]
+
+
+def pair_m_info(soup: BeautifulSoup):
+    """Returns the list of 4-tuples (title, year, link, poster link) of the movies from one page of an IMDb movie list,
+    from the h3 tags with movie titles and the poster divs only, so it works with targeted soups (MOVIE_ITEMS),
+    which have no 'lister-item' divs for extract_m_info().
+    The tags are paired by their order in the page: in each 'lister-item' div, the poster div precedes the h3 tag,
+    so an h3 tag gets the poster div found since the previous h3 tag, if any (otherwise, the poster link is None).
+    """
+
+    pairs = []
+    poster = None
+    for tag in soup.find_all(['div', 'h3'], {'class': ['lister-item-image', 'lister-item-header']}):
+        if tag.name == 'div':
+            poster = tag
+        elif tag.a:
+            pairs.append((tag, poster))
+            poster = None
+    year_spans = (h3.find('span', {'class': "lister-item-year"}) for h3, _ in pairs)
+    year_list = get_years((span.text if span else '' for span in year_spans), default='unknown')
+    page_info = []
+    for (h3, poster), year in zip(pairs, year_list):
+        poster_link = poster.a.img.get('loadlate') if poster and poster.a and poster.a.img else None
+        page_info.append((h3.a.text.strip(), year, BASE_URL + h3.a['href'].lstrip('/'), poster_link))
+    return page_info
+
+
+def get_page_m_info(soup: BeautifulSoup, url=None):
+    """Returns the list of 4-tuples (title, year, link, poster link) of the movies from one page of an IMDb movie list
+    (a full or a targeted soup; see MOVIE_ITEMS), using extract_m_info(), or pair_m_info() for targeted soups.
+    The tuples contain only str objects (or None), so they don't keep soup alive.
+    The url of the page, if given, is only used to record the extraction time for the page (see instrumented()).
+    """
+
+    start = time.perf_counter()
+    page_info = extract_m_info(soup)
+    page_info = page_info if page_info else pair_m_info(soup)
+    if crawl_stats is not None:
+        crawl_stats.record('extract', time.perf_counter() - start, url)
+    return page_info
+
+
+def iter_m_info(start_url: str, max_pages=1, max_in_flight=1, session=None, targeted=False):
+    """Generator version of get_m_info() (with the same parameters) that yields the 4-tuples (title, year, link,
+    poster link) page by page, as the pages arrive. Each page's soup is decomposed as soon as its movies
+    are extracted, so memory use doesn't grow with the number of pages crawled.
+    """
+
+    pages = crawl(start_url, max_pages, max_in_flight, session, MOVIE_ITEMS if targeted else None)
+    for page, soup in enumerate(pages, 1):
+        page_info = get_page_m_info(soup, get_specific_page(start_url, page))
+        soup.decompose()
+        del soup                                            # don't keep the (empty) soup while the movies are used
+        yield from page_info
+
+
+class MovieParser(HTMLParser):
+    """Incremental parser of IMDb movie list pages: feed() it the text of a page in chunks (e.g., as they arrive
+    from the network), and it appends the 4-tuple (title, year, link, poster link) of each movie to records
+    as soon as the end of the movie's 'lister-item' div has been fed (as in get_item_m_info(); no tree is built).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.item_depth = None                              # div depth of the current 'lister-item' div, if any
+        self.div_depth = 0
+        self.field = None                                   # 'title' or 'year' while their text is being read
+        self.in_image = self.in_h3 = False
+        self.title = self.year = self.link = self.poster = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if tag == 'div':
+            self.div_depth += 1
+            if 'lister-item' in classes and self.item_depth is None:
+                self.item_depth = self.div_depth
+                self.title = self.year = self.link = self.poster = None
+            elif self.item_depth is not None:
+                self.in_image = 'lister-item-image' in classes
+        elif self.item_depth is None:
+            return
+        elif tag == 'img' and self.in_image and self.poster is None:
+            self.poster = attrs.get('loadlate')
+        elif tag == 'h3' and 'lister-item-header' in classes:
+            self.in_h3 = True
+        elif tag == 'a' and self.in_h3 and self.link is None:
+            self.link, self.title, self.field = attrs.get('href', ''), '', 'title'
+        elif tag == 'span' and self.in_h3 and 'lister-item-year' in classes and self.year is None:
+            self.year, self.field = '', 'year'
+
+    def handle_endtag(self, tag):
+        if tag == 'div':
+            if self.div_depth == self.item_depth:
+                self.item_depth = None
+                if self.link is not None:
+                    year = get_4_digit_substring(self.year) if self.year else None
+                    self.records.append((self.title.strip(), year if year else 'unknown',
+                                         BASE_URL + self.link.lstrip('/'), self.poster))
+            self.div_depth -= 1
+            self.in_image = False
+        elif tag == 'h3':
+            self.in_h3 = False
+        elif tag in ('a', 'span'):
+            self.field = None
+
+    def handle_data(self, data):
+        if self.field == 'title':
+            self.title += data
+        elif self.field == 'year':
+            self.year += data
+
+
+def stream_page_m_info(url: str, session=None, chunk_size=16384):
+    """Generator that yields the 4-tuples (title, year, link, poster link) of the movies from one page of an IMDb
+    movie list, reading the response body in chunks of chunk_size bytes through session (by default, the shared
+    session; see get_session()) and feeding them to a MovieParser, so each movie is yielded as soon as its markup
+    has arrived, and neither the whole text of the page nor its tree is ever kept in memory.
+    """
+
+    with (session if session else get_session()).get(url, allow_redirects=False, stream=True) as response:
+        response.raise_for_status()
+        if response.encoding is None:
+            response.encoding = 'utf-8'
+        parser = MovieParser()
+        for chunk in response.iter_content(chunk_size=chunk_size, decode_unicode=True):
+            parser.feed(chunk)
+            yield from parser.records
+            parser.records.clear()
+        parser.close()
+        yield from parser.records
+
+
+def stream_m_info(start_url: str, max_pages=1, session=None, chunk_size=16384):
+    """Like iter_m_info(), but each page is parsed incrementally, as it arrives (see stream_page_m_info()).
+    """
+
+    for page in range(1, max_pages + 1):
+        yield from stream_page_m_info(get_specific_page(start_url, page), session, chunk_size)
+
+
+def parse_m_info(text, parser='html.parser', targeted=False):
+    """Returns the list of 4-tuples (title, year, link, poster link) of the movies from the text of one page
+    of an IMDb movie list, parsed with parser (see get_soup() and get_page_m_info()).
+    Runs in the worker processes of iter_m_info_pipelined(), so only text and the tuples cross process boundaries.
+    """
+
+    return get_page_m_info(BeautifulSoup(text, parser, parse_only=MOVIE_ITEMS if targeted else None))
+
+
+def create_parser_pool(max_workers=None):
+    """Returns a new pool of max_workers processes (by default, one per CPU core) for iter_m_info_pipelined(),
+    which can be reused by any number of its calls (and shut down by the caller). The worker processes are spawned,
+    not forked: forking a process that runs other threads (the fetcher's, the caller's) could copy a lock held
+    by one of them, e.g. the lock of crawl_stats, into the workers. Create the pool before starting any threads.
+    """
+
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context('spawn'))
+
+
+def iter_m_info_pipelined(start_url: str, max_pages=1, max_in_flight=4, max_workers=None, session=None,
+                          targeted=False, parser=None):
+    """Like iter_m_info() (yields the 4-tuples (title, year, link, poster link) in page order), but as a pipeline:
+    up to max_in_flight pages are fetched concurrently in threads (the network I/O releases the GIL),
+    and each fetched page is parsed and its movies are extracted in a pool of max_workers processes
+    (by default, one per CPU core; see parse_m_info()), so the CPU-bound parsing is not limited to one core.
+    The pool is parser, a pool from create_parser_pool() with max_workers processes, which is left running;
+    if parser is None, a new pool is created (spawning the processes takes a while) and shut down at the end.
+    The parsing in the worker processes is not recorded by instrumented() (the fetching is).
+    """
+
+    max_workers = max_workers if max_workers else os.cpu_count()
+    own_parser = parser is None
+    if own_parser:
+        parser = create_parser_pool(max_workers)            # before any thread
+    fetcher = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def fetch(page):                                        # in the fetcher's threads
+        text = get_page(get_specific_page(start_url, page), session)
+        return parser.submit(parse_m_info, text, soup_parser, targeted)
+
+    in_flight = deque()
+    try:
+        pages = iter(range(1, max_pages + 1))
+        window = max_in_flight + 2 * max_workers            # pages being fetched, parsed, or waiting for either
+        in_flight.extend(fetcher.submit(fetch, page) for page in islice(pages, window))
+        while in_flight:
+            page_info = in_flight.popleft().result().result()
+            for page in islice(pages, 1):
+                in_flight.append(fetcher.submit(fetch, page))
+            yield from page_info
+    finally:
+        fetcher.shutdown(wait=False, cancel_futures=True)
+        if own_parser:
+            parser.shutdown(wait=False, cancel_futures=True)
+        else:                                               # only this crawl's pages are dropped from a shared pool
+            for future in in_flight:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    future.result().cancel()
+
+
+class CrawlCheckpoint:
+    """The class describing the checkpoint of a crawl of a multi-page IMDb movie list from start_url:
+    a JSON Lines file (relative file names are located in the data directory) with the start_url in the first line
+    and then one line {"page": <page number>, "records": [<4-tuples (title, year, link, poster link)>]} per page.
+    A line is appended (and flushed to disk) as soon as a page is done, so a crawl that dies loses only the pages
+    in progress; a line cut off by an interruption is ignored. A page with no records marks the end of the list.
+    A page that has several lines (it was crawled again) has the records of the last one.
+    """
+
+    def __init__(self, start_url, file_name='crawl_checkpoint.jsonl'):
+        self.file = utility.get_data_file(file_name)
+        self.start_url = start_url
+        self.pages = {}                                     # {<page number>: [<4-tuples>]}
+        if not self.file.exists():
+            self.__append([{'start_url': start_url}])
+            return
+        with open(self.file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if 'start_url' in entry and entry['start_url'] != start_url:
+                    raise ValueError(f'{self.file} is the checkpoint of another crawl ({entry["start_url"]})')
+                if 'page' in entry:
+                    self.pages[entry['page']] = [tuple(r) for r in entry['records']]
+
+    def __str__(self):
+        return f'Crawl checkpoint {self.file.name}: {len(self.pages)} pages, {len(self.records())} records'
+
+    def __append(self, entries):
+        with open(self.file, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @property
+    def last_page(self):
+        return max(self.pages, default=0)
+
+    @property
+    def finished(self):
+        """True if the end of the movie list (a page with no records) has been reached.
+        """
+
+        return bool(self.pages) and not self.pages[self.last_page]
+
+    def records(self):
+        return [info for page in sorted(self.pages) for info in self.pages[page]]
+
+    def known_links(self):
+        return {link for page_info in self.pages.values() for _, _, link, _ in page_info}
+
+    def add_pages(self, pages):
+        """Records the pages (a dict {<page number>: [<4-tuples>]}) as done, all in one write.
+        The records of a page that is already in the checkpoint replace those it had.
+        """
+
+        self.__append({'page': page, 'records': page_info} for page, page_info in pages.items())
+        self.pages.update((page, list(page_info)) for page, page_info in pages.items())
+
+    def clear(self):
+        self.file.unlink(missing_ok=True)
+        self.pages = {}
+
+
+def resumable_m_info(start_url: str, max_pages=1, checkpoint='crawl_checkpoint.jsonl', max_in_flight=1, session=None,
+                     incremental=False):
+    """Returns the same list of 4-tuples (title, year, link, poster link) as get_m_info() (with the same parameters),
+    but keeps a CrawlCheckpoint in the checkpoint file, so that:
+    - a crawl that died (or was stopped) is resumed from the page after the last completed one,
+      and a finished crawl is not repeated (the records are taken from the checkpoint)
+    - if incremental is True, the crawl starts from the first page again, but stops at the first page
+      whose movies are all known from the checkpoint; the pages with new movies replace those in the checkpoint
+      (and the known movies pushed off them by the new ones are kept, with the next page), all at once
+      at the end (so an interrupted incremental crawl is simply done again next time)
+    The crawl also stops at the first page with no movies (the end of the list).
+    """
+
+    state = CrawlCheckpoint(start_url, checkpoint)
+    if incremental:
+        known = state.known_links()
+        new_pages = {}
+        end_reached = False
+        with closing(crawl(start_url, max_pages, max_in_flight, session)) as pages:
+            for page, soup in enumerate(pages, 1):
+                page_info = get_page_m_info(soup, get_specific_page(start_url, page))
+                soup.decompose()
+                if all(info[2] in known for info in page_info):
+                    end_reached = not page_info
+                    break
+                new_pages[page] = page_info
+        if new_pages:
+            crawled = {info[2] for page_info in new_pages.values() for info in page_info}
+            pushed_off = [info for page in new_pages for info in state.pages.get(page, []) if info[2] not in crawled]
+            next_page = max(new_pages) + 1
+            if pushed_off and not end_reached:
+                new_pages[next_page] = pushed_off + state.pages.get(next_page, [])
+            state.add_pages(new_pages)
+    elif not state.finished:
+        first_page = state.last_page + 1
+        with closing(crawl(start_url, max_pages, max_in_flight, session, first_page=first_page)) as pages:
+            for page, soup in enumerate(pages, first_page):
+                page_info = get_page_m_info(soup, get_specific_page(start_url, page))
+                soup.decompose()
+                state.add_pages({page: page_info})
+                if not page_info:
+                    break
+    return state.records()
+
+
+def benchmark_extract(page_file='soup.html'):
+    """Extracts the movies from a saved IMDb movie list page (by default, data/soup.html), parsed in advance,
+    by pairing the h3 tags with the poster divs (pair_m_info(), as for targeted soups)
+    and in a single traversal of the 'lister-item' divs (extract_m_info()).
+    Returns a dict: {<extractor>: <time in seconds>}.
+    """
+
+    soup = BeautifulSoup(utility.get_data_file(page_file).read_text(encoding='utf-8'), soup_parser)
+    assert extract_m_info(soup) == pair_m_info(soup)
+    return {'pair_m_info()': utility.measure_time(pair_m_info, soup, repeat=10),
+            'extract_m_info()': utility.measure_time(extract_m_info, soup, repeat=10)}
+
+
+def benchmark_years(page_file='soup.html', n_copies=1000):
+    """Extracts the years of the movies from the raw year strings (e.g., '(I) (2019)') found in a saved IMDb movie list
+    page (by default, data/soup.html), repeated n_copies times: with all 4-char slices of each string
+    (the original get_4_digit_substring()), with the regex, one string at a time, and with get_years().
+    Returns a dict: {<extractor>: <time in seconds>}.
+    """
+
+    soup = BeautifulSoup(utility.get_data_file(page_file).read_text(encoding='utf-8'), soup_parser)
+    year_strings = [span.text for span in soup.find_all('span', {'class': "lister-item-year"})] * n_copies
+
+    def get_4_digit_slice(a_string):
+        all_4_digit_substrings = [a_string[i:(i+4)] for i in range(0, len(a_string) - 3)]
+        return next((x for x in all_4_digit_substrings if x.isdigit()), None)
+
+    assert [get_4_digit_slice(y) for y in year_strings] == [get_4_digit_substring(y) for y in year_strings] == \
+        get_years(year_strings)
+    return {'4-char slices': utility.measure_time(lambda: [get_4_digit_slice(y) for y in year_strings]),
+            'regex': utility.measure_time(lambda: [get_4_digit_substring(y) for y in year_strings]),
+            'get_years()': utility.measure_time(get_years, year_strings)}
+
+
+def benchmark_crawl(max_pages=10, latency=0.5, max_in_flight=5):
+    """Crawls max_pages pages from a local stand-in server (music.standin) that responds after latency seconds,
+    first one page at a time and then with up to max_in_flight pages in flight.
+    Returns a dict: {<crawl mode>: <crawl time in seconds>}.
+    """
+
+    with StandInServer(latency=latency) as server:
+        return {'sequential': utility.measure_time(lambda: list(crawl(server.start_url, max_pages)), repeat=1),
+                f'{max_in_flight} in flight': utility.measure_time(
+                    lambda: list(crawl(server.start_url, max_pages, max_in_flight)), repeat=1)}
+
+
+def benchmark_throughput(n_pages=40, items_per_page=50, latency=0.05, error_rate=0.0, in_flight=(1, 4, 16)):
+    """Crawls a synthetic movie list of n_pages pages from a local stand-in server (music.standin), with each
+    of the max_in_flight values from in_flight, and then replays the same crawl from recorded fixtures
+    (with iter_m_info() and with stream_m_info(), which must get the same movies).
+    Returns a dict: {<crawl mode>: (<number of movies>, <pages per second>)}.
+    """
+
+    results = {}
+    with StandInServer(latency=latency, n_pages=n_pages, items_per_page=items_per_page, error_rate=error_rate) \
+            as server:
+        for max_in_flight in in_flight:
+            with create_session(pool_maxsize=max_in_flight) as new_session:
+                start = time.perf_counter()
+                n_movies = sum(1 for _ in iter_m_info(server.start_url, n_pages, max_in_flight, new_session))
+                results[f'{max_in_flight} in flight'] = (n_movies, n_pages / (time.perf_counter() - start))
+        with create_replay_session('benchmark_fixtures', record=True) as recording_session:
+            list(crawl(server.start_url, n_pages, max(in_flight), recording_session))
+    with create_replay_session('benchmark_fixtures') as replay_session:
+        start = time.perf_counter()
+        movies = list(iter_m_info(server.start_url, n_pages, session=replay_session))
+        results['replay'] = (len(movies), n_pages / (time.perf_counter() - start))
+        start = time.perf_counter()
+        streamed_movies = list(stream_m_info(server.start_url, n_pages, replay_session))
+        results['replay, streaming'] = (len(streamed_movies), n_pages / (time.perf_counter() - start))
+        assert streamed_movies == movies
+        fixtures = replay_session.get_adapter(server.start_url).cache
+        fixtures.clear()
+        fixtures.directory.rmdir()
+    return results
+
+
+def benchmark_checkpoint(n_pages=20, latency=0.05):
+    """Crawls a synthetic movie list of n_pages pages from a local stand-in server (music.standin) with
+    resumable_m_info(): first only half of the pages (as if the crawl had died), then all of them (resuming),
+    and then incrementally (all movies known from the checkpoint).
+    Returns a dict: {<crawl>: (<number of movies>, <pages fetched>, <time in seconds>)}.
+    """
+
+    results = {}
+    with StandInServer(latency=latency, n_pages=n_pages) as server:
+        for run, max_pages, incremental in (('interrupted', n_pages // 2, False), ('resumed', n_pages, False),
+                                            ('incremental', n_pages, True)):
+            requests_count = server.requests_count
+            start = time.perf_counter()
+            n_movies = len(resumable_m_info(server.start_url, max_pages, 'benchmark_checkpoint.jsonl',
+                                            incremental=incremental))
+            results[run] = (n_movies, server.requests_count - requests_count, time.perf_counter() - start)
+    CrawlCheckpoint(server.start_url, 'benchmark_checkpoint.jsonl').clear()
+    return results
+
+
+def benchmark_rate_limit(n_pages=60, max_rate=20, latency=0.02, in_flight=(4, 16)):
+    """Crawls a synthetic movie list of n_pages pages from a local stand-in server (music.standin) that throttles
+    the clients sending more than max_rate requests per second (429 Too Many Requests), through a session
+    with a RateLimiter, with each of the max_in_flight values from in_flight.
+    Returns a dict: {<max_in_flight>: <RateLimiter.report(), plus the number of movies ('movies')
+    and the number of requests throttled by the server ('throttled')>}.
+    """
+
+    results = {}
+    for max_in_flight in in_flight:
+        with StandInServer(latency=latency, n_pages=n_pages, items_per_page=10, max_rate=max_rate) as server:
+            limiter = RateLimiter()
+            with create_session(pool_maxsize=max_in_flight, limiter=limiter) as new_session:
+                n_movies = sum(1 for _ in iter_m_info(server.start_url, n_pages, max_in_flight, new_session))
+            results[max_in_flight] = {**limiter.report(), 'movies': n_movies, 'throttled': server.throttled_count}
+    return results
+
+
+def benchmark_pipeline(n_pages=40, latency=0.02, max_in_flight=4, max_workers=None):
+    """Crawls a synthetic movie list of n_pages pages from a local stand-in server (music.standin),
+    with iter_m_info() (fetching in threads, parsing in the consumer's thread) and with iter_m_info_pipelined()
+    (parsing in a pool of max_workers processes, by default one per CPU core): with a new pool,
+    and with a pool shared by the calls (already started).
+    Returns a dict: {<function>: (<number of movies>, <time in seconds>)}.
+    """
+
+    results = {}
+    with create_parser_pool(max_workers) as parser, StandInServer(latency=latency, n_pages=n_pages) as server, \
+            create_session(pool_maxsize=max_in_flight) as new_session:
+        parser.submit(int).result()                         # the workers are spawned on demand
+        for name, function, kwargs in (('iter_m_info()', iter_m_info, {}),
+                                       ('iter_m_info_pipelined()', iter_m_info_pipelined,
+                                        {'max_workers': max_workers}),
+                                       ('iter_m_info_pipelined() (shared pool)', iter_m_info_pipelined,
+                                        {'max_workers': max_workers, 'parser': parser})):
+            start = time.perf_counter()
+            n_movies = sum(1 for _ in function(server.start_url, n_pages, max_in_flight, session=new_session,
+                                               **kwargs))
+            results[name] = (n_movies, time.perf_counter() - start)
+    return results
+
+
+def benchmark_streaming_parse(latency=0.0):
+    """Gets the movies from data/soup.html, served by a local stand-in server (music.standin), with get_soup()
+    and extract_m_info(), and with stream_page_m_info().
+    Returns a dict: {<method>: (<time to the first movie>, <time to all movies>, <peak memory in bytes>)},
+    with times in seconds.
+    """
+
+    results = {}
+    with StandInServer(latency=latency) as server, create_session() as new_session:
+
+        def soup_m_info():
+            yield from extract_m_info(get_soup(server.start_url, new_session))
+
+        for name, m_info in (('get_soup(), extract_m_info()', soup_m_info),
+                             ('stream_page_m_info()', lambda: stream_page_m_info(server.start_url, new_session))):
+            start = time.perf_counter()
+            movies = m_info()
+            next(movies)
+            first = time.perf_counter() - start
+            list(movies)
+            results[name] = (first, time.perf_counter() - start, utility.measure_peak_memory(lambda: list(m_info()))[1])
+    return results
+
+
+def benchmark_session(n_pages=50, latency=0.0):
+    """Fetches the same page n_pages times from a local stand-in server (music.standin), first with a new connection
+    for each page (requests.get()) and then through a session that keeps the connection alive (get_page()).
+    Returns a dict: {<fetching mode>: (<average time per page in seconds>, <connections opened>)}.
+    """
+
+    results = {}
+    with StandInServer(latency=latency) as server:
+        connections = server.connections
+        seconds = utility.measure_time(lambda: [requests.get(server.start_url, allow_redirects=False).text
+                                                for _ in range(n_pages)], repeat=1)
+        results['requests.get()'] = (seconds / n_pages, server.connections - connections)
+        with create_session() as new_session:
+            connections = server.connections
+            seconds = utility.measure_time(lambda: [get_page(server.start_url, new_session) for _ in range(n_pages)],
+                                           repeat=1)
+            results['session'] = (seconds / n_pages, server.connections - connections)
+    return results
+
+
+def benchmark_parse(page_file='soup.html', parsers=FAST_PARSERS):
+    """Parses a saved IMDb movie list page (by default, data/soup.html) with each of the installed parsers,
+    building the full tree and doing a targeted parse (MOVIE_ITEMS), and extracts the movies (get_page_m_info()).
+    Returns a dict: {(<parser>, <'full' or 'targeted'>): <time in seconds>}.
+    """
+
+    text = utility.get_data_file(page_file).read_text(encoding='utf-8')
+
+    def parse(parser, parse_only):
+        return get_page_m_info(BeautifulSoup(text, parser, parse_only=parse_only))
+
+    results = {}
+    for parser in get_available_parsers(parsers):
+        assert parse(parser, None) == parse(parser, MOVIE_ITEMS)
+        results[(parser, 'full')] = utility.measure_time(parse, parser, None, repeat=3)
+        results[(parser, 'targeted')] = utility.measure_time(parse, parser, MOVIE_ITEMS, repeat=3)
+    return results
+
+
+def benchmark_streaming(max_pages=20, targeted=False):
+    """Crawls max_pages pages from a local stand-in server (music.standin), accumulating the soups of all pages
+    and extracting the movies at the end (as get_m_info() used to do, keeping the tags of all pages until then),
+    and counting the movies as they are yielded by iter_m_info().
+    Returns a dict: {<function>: (<number of movies>, <peak memory in bytes>)}.
+    """
+
+    def accumulating_m_info(url):
+        soups = list(crawl(url, max_pages, session=new_session, parse_only=MOVIE_ITEMS if targeted else None))
+        return [info for soup in soups for info in get_page_m_info(soup)]
+
+    with StandInServer() as server, create_session() as new_session:
+        return {'accumulating': utility.measure_peak_memory(lambda: len(accumulating_m_info(server.start_url))),
+                'iter_m_info()': utility.measure_peak_memory(
+                    lambda: sum(1 for _ in iter_m_info(server.start_url, max_pages, session=new_session,
+                                                       targeted=targeted)))}
 
 
 if __name__ == "__main__":
@@ -290,6 +1028,70 @@ if __name__ == "__main__":
     #         break
     # print()
 
+    # # Test concurrent crawl() against the local stand-in server
+    # for mode, seconds in benchmark_crawl().items():
+    #     print(f'{mode:15}{seconds:8.2f} s')
+    # print()
+
+    # # Test the shared session (connection pooling, keep-alive) against the local stand-in server
+    # for mode, (seconds, connections) in benchmark_session().items():
+    #     print(f'{mode:15}{seconds * 1000:8.2f} ms/page{connections:5} connections')
+    # print()
+
+    # # Measure the crawl throughput over a synthetic movie list on the local stand-in server, and in replay mode
+    # for mode, (n_movies, pages_per_second) in benchmark_throughput().items():
+    #     print(f'{mode:15}{n_movies:8} movies{pages_per_second:10.1f} pages/s')
+    # print()
+
+    # # Interrupt, resume and then incrementally repeat a crawl with checkpoints on the local stand-in server
+    # for run, (n_movies, n_pages, seconds) in benchmark_checkpoint().items():
+    #     print(f'{run:15}{n_movies:8} movies{n_pages:5} pages fetched{seconds:8.2f} s')
+    # print()
+
+    # # Crawl a local stand-in server that throttles its clients, through a session with a RateLimiter
+    # for max_in_flight, report in benchmark_rate_limit().items():
+    #     print(f'{max_in_flight:3} in flight: {report["pages_per_second"]:6.1f} pages/s, '
+    #           f'{report["retries"]} retries, {report["throttled"]} throttled')
+    # print()
+
+    # # Record and print the statistics of a crawl of the local stand-in server (see music.instrument)
+    # with StandInServer(latency=0.02, n_pages=20) as server, instrumented() as stats:
+    #     get_m_info(server.start_url, max_pages=20, max_in_flight=4)
+    # print(stats)
+    # stats.write_report()
+    # print()
+
+    # # Compare parsing in the consumer's thread with parsing in a process pool (one process per CPU core)
+    # for function, (n_movies, seconds) in benchmark_pipeline().items():
+    #     print(f'{function:40}{n_movies:8} movies{seconds:8.2f} s')
+    # print()
+
+    # # Compare the time to the first movie, to all movies and the peak memory of parsing a whole page and streaming it
+    # for method, (first, total, peak) in benchmark_streaming_parse().items():
+    #     print(f'{method:30}first {first * 1000:8.2f} ms, all {total * 1000:8.2f} ms, peak {peak:12,} bytes')
+    # print()
+
+    # # Compare full and targeted (SoupStrainer) parsing of data/soup.html with the installed parsers
+    # configure_parser()                  # selects lxml if it is installed
+    # for (parser, mode), seconds in benchmark_parse().items():
+    #     print(f'{parser:15}{mode:10}{seconds * 1000:8.2f} ms')
+    # print()
+
+    # # Compare the peak memory of get_m_info() and iter_m_info() against the local stand-in server
+    # for function, (n_movies, peak) in benchmark_streaming().items():
+    #     print(f'{function:15}{n_movies:6} movies, peak {peak:15,} bytes')
+    # print()
+
+    # # Compare the extraction of movies from data/soup.html by pairing h3 tags with posters and in one traversal
+    # for extractor, seconds in benchmark_extract().items():
+    #     print(f'{extractor:18}{seconds * 1000:8.2f} ms')
+    # print()
+
+    # # Compare the ways of extracting the years of the movies from the raw year strings in data/soup.html
+    # for extractor, seconds in benchmark_years().items():
+    #     print(f'{extractor:15}{seconds * 1000:8.2f} ms')
+    # print()
+
     # # Test get_4_digit_substring()
     # print(get_4_digit_substring('Lennon 1940-1980'))
     # print(get_4_digit_substring('(1940)'))
@@ -0,0 +1,216 @@
+"""Persistent (on-disk) cache of HTTP responses for the crawler, with conditional revalidation.
+The cache plugs into requests as a transport adapter (see CachingAdapter and crawl.create_session()).
+requests documentation on transport adapters: https://requests.readthedocs.io/en/latest/user/advanced/#transport-adapters
+"""
+
+from hashlib import sha256
+import json
+import os
+from threading import Lock
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from util.utility import get_data_file
+
+# Response headers stored in the cache along with the body
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+def normalize_url(url):
+    """Returns the normalized form of url, so that equivalent URLs share a cache entry:
+    lowercase scheme and host, no default port, query parameters sorted by name, no fragment.
+    """
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname.lower() if parts.hostname else ''
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        netloc += f':{parts.port}'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path if parts.path else '/', query, ''))
+
+
+class ResponseCache:
+    """The class describing an on-disk cache of HTTP responses (by default, in data/http_cache).
+    Each entry is stored in two files named after the hash of the normalized URL:
+    <hash>.body (the response body) and <hash>.json (the URL, the stored headers and the time of fetching).
+    Parameters:
+    - directory: the cache directory; relative paths are located in the data directory
+    - max_size: the max total size of the stored bodies, in bytes; the least recently used entries are evicted first
+    - max_age: the number of seconds after fetching during which an entry is served without network access;
+      after that, it is revalidated with a conditional GET request (If-None-Match/If-Modified-Since)
+    - offline: if True, entries are always served from the cache, regardless of their age,
+      and the requests for URLs that are not in the cache fail (raise requests.ConnectionError)
+    """
+
+    def __init__(self, directory='http_cache', max_size=200_000_000, max_age=3600, offline=False):
+        self.directory = get_data_file(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.offline = offline
+        self.__lock = Lock()
+        # {<key>: <body size>}, least recently used first; the files are stat'ed only here, and then the order
+        # is kept up to date by get() and put(), so eviction doesn't have to look at the files
+        bodies = sorted(((body.stem, body.stat()) for body in self.directory.glob('*.body')),
+                        key=lambda entry: entry[1].st_mtime)
+        self.__sizes = {key: stat.st_size for key, stat in bodies}
+        self.size = sum(self.__sizes.values())
+
+    def __len__(self):
+        return len(self.__sizes)
+
+    def __str__(self):
+        return f'Response cache {self.directory}: {len(self)} entries, {self.size:,} bytes'
+
+    def __key(self, url):
+        return sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+    def get(self, url):
+        """Returns a 2-tuple (<body (bytes)>, <metadata dict>) of the entry for url, or None if there is none.
+        The metadata include the stored headers and the time of fetching (key 'fetched').
+        """
+
+        key = self.__key(url)
+        body_file = self.directory / f'{key}.body'
+        try:
+            metadata = json.loads((self.directory / f'{key}.json').read_text(encoding='utf-8'))
+            body = body_file.read_bytes()
+            os.utime(body_file)                             # the modification time is the time of the last use
+        except (FileNotFoundError, ValueError):             # e.g., evicted meanwhile by another thread
+            return None
+        with self.__lock:
+            if key in self.__sizes:
+                self.__sizes[key] = self.__sizes.pop(key)   # now the most recently used
+        return body, metadata
+
+    def is_fresh(self, metadata):
+        return self.offline or time.time() - metadata['fetched'] < self.max_age
+
+    def put(self, url, body, headers):
+        """Stores the response body and headers (only those from CACHED_HEADERS) for url,
+        and evicts the least recently used entries if the cache has grown over max_size.
+        """
+
+        key = self.__key(url)
+        metadata = {'url': normalize_url(url), 'fetched': time.time(),
+                    'headers': {k: headers[k] for k in CACHED_HEADERS if k in headers}}
+        with self.__lock:
+            for suffix, data in (('.body', body), ('.json', json.dumps(metadata).encode('utf-8'))):
+                temp_file = self.directory / f'{key}{suffix}.tmp'
+                temp_file.write_bytes(data)
+                os.replace(temp_file, self.directory / f'{key}{suffix}')   # other threads never see partial files
+            self.size += len(body) - self.__sizes.pop(key, 0)
+            self.__sizes[key] = len(body)                   # the most recently used
+            self.__evict()
+
+    def refresh(self, url, headers=None):
+        """Marks the entry for url as just fetched (after a successful revalidation), and updates its stored headers
+        with those from headers (the headers of the 304 Not Modified response, e.g. a new ETag) that are in
+        CACHED_HEADERS. Does nothing if there is no such entry (e.g., it has been evicted meanwhile).
+        """
+
+        metadata_file = self.directory / f'{self.__key(url)}.json'
+        with self.__lock:
+            try:
+                metadata = json.loads(metadata_file.read_text(encoding='utf-8'))
+            except (FileNotFoundError, ValueError):
+                return
+            metadata['fetched'] = time.time()
+            if headers:
+                metadata['headers'].update({k: headers[k] for k in CACHED_HEADERS if k in headers})
+            temp_file = metadata_file.with_name(metadata_file.name + '.tmp')
+            temp_file.write_text(json.dumps(metadata), encoding='utf-8')
+            os.replace(temp_file, metadata_file)
+
+    def __remove(self, key):
+        for suffix in ('.body', '.json'):
+            (self.directory / f'{key}{suffix}').unlink(missing_ok=True)
+        self.size -= self.__sizes.pop(key, 0)
+
+    def __evict(self):
+        while self.size > self.max_size and self.__sizes:
+            self.__remove(next(iter(self.__sizes)))         # the least recently used
+
+    def clear(self):
+        with self.__lock:
+            for key in list(self.__sizes):
+                self.__remove(key)
+
+
+class CachingAdapter(HTTPAdapter):
+    """Transport adapter that serves GET requests from a ResponseCache when possible.
+    Fresh entries are served without network access; stale ones are revalidated with a conditional GET request,
+    and served from the cache if the server responds with 304 Not Modified.
+    Responses served from the cache have the header X-Cache: HIT.
+    The kwargs (e.g., pool_maxsize) are passed to HTTPAdapter.
+    """
+
+    def __init__(self, cache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+        entry = self.cache.get(request.url)
+        if entry and self.cache.is_fresh(entry[1]):
+            return self.build_cached_response(request, *entry)
+        if self.cache.offline:
+            raise requests.ConnectionError(f'{request.url} is not in the cache (offline)', request=request)
+
+        if entry:
+            headers = entry[1]['headers']
+            if 'ETag' in headers:
+                request.headers['If-None-Match'] = headers['ETag']
+            if 'Last-Modified' in headers:
+                request.headers['If-Modified-Since'] = headers['Last-Modified']
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry:
+            response.close()
+            self.cache.refresh(request.url, response.headers)
+            body, metadata = entry
+            metadata['headers'].update({k: response.headers[k] for k in CACHED_HEADERS if k in response.headers})
+            return self.build_cached_response(request, body, metadata)
+        if response.status_code == 200:
+            self.cache.put(request.url, response.content, response.headers)
+        return response
+
+    def build_cached_response(self, request, body, metadata):
+        """Returns a requests.Response object for request, built from a cache entry.
+        """
+
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.headers = CaseInsensitiveDict({**metadata['headers'], 'X-Cache': 'HIT'})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response._content_consumed = True               # there is no raw stream (e.g., for iter_content(), close())
+        return response
+
+
+if __name__ == "__main__":
+
+    from music.crawl import create_session, get_m_info
+    from music.standin import StandInServer
+
+    # Crawl the local stand-in server twice; the second time, all pages are served from the cache
+    cache = ResponseCache('http_cache_demo', max_age=60)
+    with StandInServer(latency=0.2) as server:
+        with create_session(cache=cache) as session:
+            for _ in range(2):
+                start = time.perf_counter()
+                movies = get_m_info(server.start_url, max_pages=3, session=session)
+                print(f'{len(movies)} movies, {time.perf_counter() - start:.2f} s, '
+                      f'{server.requests_count} requests served, {cache}')
+    cache.clear()
+    cache.directory.rmdir()
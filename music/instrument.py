@@ -0,0 +1,155 @@
+"""Instrumentation of crawls: per-stage timings and sizes of the pages, aggregated into histograms.
+See crawl.instrumented() for recording the statistics of a crawl.
+"""
+
+from bisect import bisect_left
+import json
+from threading import Lock
+import time
+
+from util.utility import get_data_file
+
+# Histogram bucket upper bounds: times in seconds (1 ms to ~16 s) and sizes in bytes (1 KB to ~16 MB), doubling
+TIME_BOUNDS = tuple(0.001 * 2 ** i for i in range(15))
+SIZE_BOUNDS = tuple(1024 * 2 ** i for i in range(15))
+
+# The metrics recorded by the crawler, with their units:
+# - fetch: latency of a page, from sending the request to receiving the whole body (crawl.get_page())
+# - bytes: size of the (decoded) body of a page
+# - parse: building the BeautifulSoup object of a page (crawl.get_soup())
+# - wait: time the consumer of crawl() waited for the next page (less than fetch + parse if pages are in flight)
+# - extract: extracting the movies from a page (crawl.get_page_m_info())
+METRICS = {'fetch': 's', 'bytes': 'B', 'parse': 's', 'wait': 's', 'extract': 's'}
+
+
+class Histogram:
+    """The class describing a histogram of values, with buckets given by their upper bounds
+    (the last bucket holds all values greater than the last bound).
+    """
+
+    def __init__(self, bounds=TIME_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+
+    def to_dict(self):
+        return {'bounds': list(self.bounds), 'counts': self.counts}
+
+    def format(self, unit='s', width=40):
+        """Returns the histogram as text, one line per bucket from the first to the last non-empty one.
+        """
+
+        used = [i for i, count in enumerate(self.counts) if count]
+        if not used:
+            return ''
+        scale = width / max(self.counts)
+        lines = []
+        for i in range(used[0], used[-1] + 1):
+            bound = f'<= {format_value(self.bounds[i], unit)}' if i < len(self.bounds) else \
+                f' > {format_value(self.bounds[-1], unit)}'
+            lines.append(f'    {bound:>12} {self.counts[i]:6} {"#" * round(self.counts[i] * scale)}')
+        return '\n'.join(lines)
+
+
+def format_value(value, unit):
+    if unit == 's':
+        return f'{value * 1000:.1f} ms'
+    return f'{value / 1024:.1f} KB'
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+class CrawlStats:
+    """The class describing the statistics of a crawl: the values of each metric (see METRICS), in histograms
+    and as samples (for percentiles), and the values recorded for each page (by URL).
+    Thread-safe, so the pages can be fetched concurrently (e.g., crawl() with max_in_flight > 1).
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.end = None
+        self.samples = {metric: [] for metric in METRICS}
+        self.histograms = {metric: Histogram(SIZE_BOUNDS if unit == 'B' else TIME_BOUNDS)
+                           for metric, unit in METRICS.items()}
+        self.pages = {}                                     # {<url>: {<metric>: <value>}}
+        self.__lock = Lock()
+
+    def record(self, metric, value, url=None):
+        """Records the value of metric (one of METRICS), for the page at url if it is given.
+        """
+
+        with self.__lock:
+            self.samples[metric].append(value)
+            self.histograms[metric].add(value)
+            if url is not None:
+                self.pages.setdefault(url, {})[metric] = value
+
+    def stop(self):
+        self.end = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.end if self.end else time.perf_counter()) - self.start
+
+    def summary(self, metric):
+        """Returns a dict with the count, total, mean, median (p50), p90, p99 and max of the values of metric,
+        or just the count (0) if there are none.
+        """
+
+        values = sorted(self.samples[metric])
+        if not values:
+            return {'count': 0}
+        return {'count': len(values), 'total': sum(values), 'mean': sum(values) / len(values),
+                'p50': percentile(values, 50), 'p90': percentile(values, 90), 'p99': percentile(values, 99),
+                'max': values[-1]}
+
+    def report(self):
+        """Returns the machine-readable report of the crawl (a JSON-serializable dict): the number of pages,
+        the elapsed time, the pages per second, the summary and histogram of each metric, and the values per page.
+        """
+
+        n_pages = len(self.samples['fetch'])
+        return {'pages': n_pages, 'elapsed': self.elapsed, 'pages_per_second': n_pages / self.elapsed,
+                'metrics': {metric: {**self.summary(metric), 'unit': unit,
+                                     'histogram': self.histograms[metric].to_dict()}
+                            for metric, unit in METRICS.items()},
+                'per_page': self.pages}
+
+    def write_report(self, file_name='crawl_report.json'):
+        """Writes report() to a JSON file (relative file names are located in the data directory)
+        and returns the Path object of the file.
+        """
+
+        file = get_data_file(file_name)
+        file.write_text(json.dumps(self.report(), indent=4), encoding='utf-8')
+        return file
+
+    def __str__(self):
+        n_pages = len(self.samples['fetch'])
+        lines = [f'{n_pages} pages in {self.elapsed:.2f} s ({n_pages / self.elapsed:.1f} pages/s)']
+        for metric, unit in METRICS.items():
+            summary = self.summary(metric)
+            if not summary['count']:
+                continue
+            total = f'{summary["total"]:.2f} s' if unit == 's' else f'{summary["total"] / 1024:.1f} KB'
+            lines.append(f'{metric}: {summary["count"]} values, total {total}, '
+                         f'mean {format_value(summary["mean"], unit)}, p50 {format_value(summary["p50"], unit)}, '
+                         f'p90 {format_value(summary["p90"], unit)}, max {format_value(summary["max"], unit)}')
+            lines.append(self.histograms[metric].format(unit))
+        return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+
+    from music.crawl import get_m_info, instrumented
+    from music.standin import StandInServer
+
+    # Crawl a synthetic movie list on the local stand-in server and print the statistics
+    with StandInServer(latency=0.02, n_pages=20) as server:
+        with instrumented() as stats:
+            get_m_info(server.start_url, max_pages=20, max_in_flight=4)
+    print(stats)
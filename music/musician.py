@@ -3,6 +3,8 @@
 
 # from util import utility
 from music.enums import Vocals, Instrument
+from util.utility import measure_memory, measure_time
+import copyreg
 import json
 
 
@@ -21,6 +23,9 @@ class Musician:
     - methods - calling them by self.<method>(...) from the same class where they are defined
     """
 
+    # Data fields (keys of __dict__) that make up the compact state of the object when pickled (see __getstate__())
+    pickle_fields = ('_Musician__name', 'is_band_member')
+
     def __init__(self, name, is_band_member=True):
         self.name = name
         self.is_band_member = is_band_member
@@ -84,6 +89,34 @@ class Musician:
         words = [word.rstrip(',') for word in musician_string.split()]
         return cls(' '.join(words[:-2]), True if words[-1] == 'member' else False)
 
+    # Pickling support: the minimal state, just the values of the data fields (without the keys, like _Musician__name),
+    # for the objects of the classes from KINDS that have exactly their pickle_fields; the objects of other subclasses
+    # (e.g., defined elsewhere, with more fields) and the objects with other fields set on them keep their __dict__
+    def __getstate__(self):
+        d = self.__dict__
+        if type(self) in KINDS and len(d) == len(self.pickle_fields):
+            try:
+                return tuple([d[field] for field in self.pickle_fields])
+            except KeyError:
+                pass
+        return d
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            self.__dict__.update(state)
+        else:
+            self.__dict__.update(zip(self.pickle_fields, state))
+
+    def __reduce_ex__(self, protocol):
+        # Musician objects with the minimal state are unpickled by calling Musician(name, is_band_member),
+        # the cheapest option; other objects as copyreg.__newobj__(<class>) (i.e., without calling __init__())
+        # followed by __setstate__(state). Returning either directly skips the generic object.__reduce_ex__().
+        # The check for plain Musician objects, the most common ones, is inlined (one Python call per object).
+        d = self.__dict__
+        if type(self) is Musician and len(d) == 2 and '_Musician__name' in d and 'is_band_member' in d:
+            return Musician, (d['_Musician__name'], d['is_band_member'])
+        return copyreg.__newobj__, (type(self),), self.__getstate__()
+
 
 class MusicianEncoder(json.JSONEncoder):
     """JSON encoder for Musician objects (cls= parameter in json.dumps()).
@@ -100,15 +133,20 @@ class MusicianEncoder(json.JSONEncoder):
 
 
 def musician_py_to_json(musician):
-    """JSON encoder for Musician objects (default= parameter in json.dumps()).
+    """JSON encoder for Musician objects and objects of its subclasses (default= parameter in json.dumps()).
+    The type tag is the name of the class (e.g., "__Singer__"); enum values are encoded by their names.
     """
 
     # recommendation: always use double quotes with JSON
 
-    if isinstance(musician, Musician):
+    if isinstance(musician, SlottedMusician):
+        return {f"__{musician.__class__.__name__}__": slotted_musician_py_to_json(musician)}
+    if type(musician) is Musician:
         return {"__Musician__": musician.__dict__}
         # Alternatively:
         # return {"__Musician__": vars(musician)}
+    if isinstance(musician, Musician):
+        return {get_musician_tag(musician): musician_fields_py_to_json(musician)}
     else:
         return {f"__{musician.__class__.__name__}__": musician.__dict__}
         # Alternatively:
@@ -116,7 +154,7 @@ def musician_py_to_json(musician):
 
 
 def musician_json_to_py(musician_json):
-    """JSON decoder for Musician objects (object_hook= parameter in json.loads()).
+    """JSON decoder for Musician objects and objects of its subclasses (object_hook= parameter in json.loads()).
     """
 
     # print(type(musician_json))            # prints <class 'dict'>
@@ -129,9 +167,71 @@ def musician_json_to_py(musician_json):
         m = Musician('')
         m.__dict__.update(musician_json["__Musician__"])
         return m
+    if len(musician_json) == 1:
+        tag, fields = next(iter(musician_json.items()))
+        if tag in MUSICIAN_TAGS:
+            return musician_fields_json_to_py(MUSICIAN_TAGS[tag], fields)
+        if tag in SLOTTED_MUSICIAN_TAGS:
+            return slotted_musician_json_to_py(SLOTTED_MUSICIAN_TAGS[tag], fields)
     return musician_json
 
 
+# Data fields of the subclasses of Musician that hold enum values
+ENUM_FIELDS = {'vocals': Vocals, 'instrument': Instrument}
+
+# Compact (small int) codes of enum values: the positions of the values in their enums.
+# The values themselves are not used, since some of them are 1-tuples (e.g., Vocals.LEAD_VOCALS.value == (1,)).
+ENUM_CODES = {value: code for enum in ENUM_FIELDS.values() for code, value in enumerate(enum)}
+ENUM_VALUES = {enum: tuple(enum) for enum in ENUM_FIELDS.values()}
+
+
+def enum_py_to_json(value, compact=False):
+    """Converts an enum value (or None) to JSON: its name, or its small int code if compact is True.
+    """
+
+    if value is None:
+        return None
+    return ENUM_CODES[value] if compact else value.name
+
+
+def enum_json_to_py(enum, value):
+    """Converts an enum value encoded by enum_py_to_json() (a name or a small int code, or None)
+    back to the corresponding value of enum.
+    """
+
+    if value is None:
+        return None
+    return ENUM_VALUES[enum][value] if isinstance(value, int) else enum[value]
+
+
+def musician_fields_py_to_json(musician, compact=False):
+    """Returns the dict of the data fields of a Musician object (or an object of one of its subclasses),
+    with enum values encoded by enum_py_to_json(). For Musician objects, musician.__dict__ itself is returned.
+    """
+
+    d = musician.__dict__
+    if type(musician) is Musician:
+        return d
+    d = d.copy()
+    for field in ENUM_FIELDS:
+        if field in d:
+            d[field] = enum_py_to_json(d[field], compact)
+    return d
+
+
+def musician_fields_json_to_py(cls, fields):
+    """Creates an object of cls (Musician or one of its subclasses) from the dict of its data fields,
+    as returned by musician_fields_py_to_json(). As in musician_json_to_py(), the object's __dict__ is updated
+    directly, without calling __init__().
+    """
+
+    m = cls.__new__(cls)
+    m.__dict__.update(fields)
+    for field in ENUM_FIELDS.keys() & fields.keys():
+        m.__dict__[field] = enum_json_to_py(ENUM_FIELDS[field], fields[field])
+    return m
+
+
 class Singer(Musician):
     """The class describing the concept of singer.
     It is assumed that a singer is sufficiently described as a Musician,
@@ -143,6 +243,8 @@ class Singer(Musician):
     #     super().__init__(name, is_band_member)
     #     self.vocals = vocals if isinstance(vocals, Vocals) else None
 
+    pickle_fields = Musician.pickle_fields + ('vocals',)
+
     # Version 2 - with multiple inheritance
     def __init__(self, vocals, **kwargs):
         super().__init__(**kwargs)
@@ -178,6 +280,8 @@ class Songwriter(Musician):
     #     self.instrument = instrument if isinstance(instrument, Instrument) else None
     #     self.writes_songs = True
 
+    pickle_fields = Musician.pickle_fields + ('instrument', 'writes_songs')
+
     # Version 2 - with multiple inheritance
     def __init__(self, instrument, **kwargs):
         super().__init__(**kwargs)
@@ -205,6 +309,8 @@ class SingerSongwriter(Singer, Songwriter):
     It is assumed that a singer-songwriter is sufficiently described as a Singer who is simultaneously a Songwriter.
     """
 
+    pickle_fields = Musician.pickle_fields + ('vocals', 'instrument', 'writes_songs')
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
@@ -212,6 +318,266 @@ class SingerSongwriter(Singer, Songwriter):
         return super().__str__() + f'; {str(self.instrument.name).lower().replace("_", " ")}'
 
 
+# JSON type tags of the classes of the Musician hierarchy, used by musician_json_to_py() to pick the class
+MUSICIAN_TAGS = {f'__{cls.__name__}__': cls for cls in (Musician, Singer, Songwriter, SingerSongwriter)}
+MUSICIAN_CLASS_TAGS = {cls: tag for tag, cls in MUSICIAN_TAGS.items()}
+
+
+def get_musician_tag(musician):
+    """Returns the JSON type tag of the class of musician, or of its closest superclass from MUSICIAN_TAGS
+    (objects of other subclasses are encoded as objects of that superclass).
+    """
+
+    tag = MUSICIAN_CLASS_TAGS.get(type(musician))
+    return tag if tag else next(MUSICIAN_CLASS_TAGS[cls] for cls in type(musician).__mro__
+                                if cls in MUSICIAN_CLASS_TAGS)
+
+
+def musicians_py_to_json(musicians, compact=True):
+    """Converts an iterable of musicians to a list of dicts in the format of musician_py_to_json()
+    that json.dumps() can encode without the default= parameter, i.e. without a fallback call for each object.
+    Enum values are encoded by their small int codes if compact is True (the default), or by their names.
+    """
+
+    return [{get_musician_tag(m): musician_fields_py_to_json(m, compact)} if isinstance(m, Musician) else
+            {f"__{m.__class__.__name__}__": slotted_musician_py_to_json(m, compact)}
+            for m in musicians]
+
+
+def musicians_json_to_py(musicians_json):
+    """Converts a list of dicts created by musicians_py_to_json() (e.g., returned by json.loads()
+    without the object_hook= parameter) back to a list of musicians.
+    """
+
+    return [musician_json_to_py(m) for m in musicians_json]
+
+
+def benchmark_musician_codec(n=100_000):
+    """Compares encoding a roster of n singers and songwriters with json.dumps(..., default=musician_py_to_json)
+    and with json.dumps(musicians_py_to_json(...)).
+    Returns a dict: {<encoding>: (<payload size in bytes>, <encoding time in seconds>)}.
+    """
+
+    roster = [SingerSongwriter(name=f'Musician {i}', vocals=Vocals.LEAD_VOCALS, instrument=Instrument.BASS)
+              if i % 2 else Singer(name=f'Musician {i}', vocals=Vocals.BACKGROUND_VOCALS) for i in range(n)]
+
+    def with_default():
+        return json.dumps(roster, default=musician_py_to_json)
+
+    def in_bulk():
+        return json.dumps(musicians_py_to_json(roster))
+
+    assert musicians_json_to_py(json.loads(in_bulk())) == json.loads(with_default(), object_hook=musician_json_to_py)
+    return {'default= per object': (len(with_default()), measure_time(with_default, repeat=3)),
+            'in bulk, compact enums': (len(in_bulk()), measure_time(in_bulk, repeat=3))}
+
+
+class SlottedMusician:
+    """Memory-compact counterpart of the Musician class.
+    The data fields are stored in __slots__ instead of a per-instance __dict__, which saves a lot of memory
+    when there are millions of musicians in memory at the same time; the methods are the same as in Musician.
+
+    Only one of the bases of a class can add slots to the object layout; otherwise Python raises
+    'TypeError: multiple bases have instance lay-out conflict'. That's why the slots of the whole hierarchy
+    (including the diamond SlottedSingerSongwriter(SlottedSinger, SlottedSongwriter)) are declared here,
+    and the subclasses declare empty __slots__. The fields class variable lists the fields each class actually uses.
+    """
+
+    __slots__ = ('__name', 'is_band_member', 'vocals', 'instrument')
+    fields = ('name', 'is_band_member')
+
+    def __init__(self, name, is_band_member=True):
+        self.name = name
+        self.is_band_member = is_band_member
+
+    @property
+    def name(self):
+        return self.__name
+
+    @name.setter
+    def name(self, name):
+        self.__name = name if name and isinstance(name, str) else 'unknown'
+
+    @property
+    def complete_info(self):
+        return self
+
+    def __str__(self):
+        band_member_str = f'band member' if self.is_band_member else 'solo musician'
+        return f'{self.name}, {band_member_str}'
+
+    def __eq__(self, other):
+        return isinstance(other, SlottedMusician) and \
+               other.name == self.name and \
+               other.is_band_member == self.is_band_member
+
+    play = Musician.play
+    play_song = Musician.play_song
+    from_str = classmethod(Musician.from_str.__func__)
+
+    # Pickling support: the minimal state, as in Musician, for the objects of the slotted classes defined here
+    # with just their fields set; other objects are pickled with a dict of all their set slots (and __dict__, if any)
+    def __getstate__(self):
+        state = object.__getstate__(self)                   # (__dict__ or None, set slots), or just __dict__/None
+        dict_state, slot_state = state if isinstance(state, tuple) else (state, {})
+        if type(self) in SLOTTED_KINDS and len(slot_state) == len(self.fields):
+            return tuple([getattr(self, field) for field in self.fields])
+        return {**(dict_state if dict_state else {}), **slot_state}
+
+    def __setstate__(self, state):
+        for field, value in (state.items() if isinstance(state, dict) else zip(self.fields, state)):
+            setattr(self, field, value)
+
+    def __reduce_ex__(self, protocol):
+        return copyreg.__newobj__, (type(self),), self.__getstate__()
+
+
+class SlottedSinger(SlottedMusician):
+    """Memory-compact counterpart of the Singer class (see SlottedMusician for the details about __slots__).
+    """
+
+    __slots__ = ()
+    fields = SlottedMusician.fields + ('vocals',)
+
+    def __init__(self, vocals, **kwargs):
+        super().__init__(**kwargs)
+        self.vocals = vocals if isinstance(vocals, Vocals) else None
+
+    def __str__(self):
+        return super().__str__() + f'; {str(self.vocals.name).lower().replace("_", " ")}'
+
+    def __eq__(self, other):
+        return isinstance(other, SlottedSinger) and super().__eq__(other) and (self.vocals == other.vocals)
+
+    def play(self, song_title, *args, **kwargs):
+        return super().play(song_title, *args, **kwargs) + '\n' + 'Yeah!'
+
+
+class SlottedSongwriter(SlottedMusician):
+    """Memory-compact counterpart of the Songwriter class (see SlottedMusician for the details about __slots__).
+    Since every songwriter writes songs, writes_songs is a class variable here, not a data field.
+    """
+
+    __slots__ = ()
+    fields = SlottedMusician.fields + ('instrument',)
+    writes_songs = True
+
+    def __init__(self, instrument, **kwargs):
+        super().__init__(**kwargs)
+        self.instrument = instrument if isinstance(instrument, Instrument) else None
+
+    def __str__(self):
+        return super().__str__() + '; ' + self.instrument.name.lower().replace('_', ' ')
+
+    def __eq__(self, other):
+        return isinstance(other, SlottedSongwriter) and super().__eq__(other) and self.instrument == other.instrument
+
+    what_do_you_do = Songwriter.what_do_you_do
+
+
+class SlottedSingerSongwriter(SlottedSinger, SlottedSongwriter):
+    """Memory-compact counterpart of the SingerSongwriter class (see SlottedMusician for the details about __slots__).
+    """
+
+    __slots__ = ()
+    fields = SlottedMusician.fields + ('vocals', 'instrument')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+    def __str__(self):
+        return super().__str__() + f'; {str(self.instrument.name).lower().replace("_", " ")}'
+
+
+# JSON type tags of the slotted classes, used by musician_json_to_py() to pick the class to decode a dict into
+SLOTTED_MUSICIAN_TAGS = {f'__{cls.__name__}__': cls
+                         for cls in (SlottedMusician, SlottedSinger, SlottedSongwriter, SlottedSingerSongwriter)}
+
+
+# Kinds of musicians (e.g., in columnar or binary representations of rosters), in the order of their codes;
+# objects of the slotted classes are of the same kind as objects of the corresponding regular classes
+KINDS = (Musician, Singer, Songwriter, SingerSongwriter)
+SLOTTED_KINDS = (SlottedMusician, SlottedSinger, SlottedSongwriter, SlottedSingerSongwriter)
+KIND_CODES = {Musician: 0, Singer: 1, Songwriter: 2, SingerSongwriter: 3,
+              SlottedMusician: 0, SlottedSinger: 1, SlottedSongwriter: 2, SlottedSingerSongwriter: 3}
+
+
+def get_kind_code(musician):
+    """Returns the code of the kind of musician (the index of its class in KINDS).
+    Works for the subclasses of the Musician hierarchy and the slotted classes as well.
+    """
+
+    for cls in type(musician).__mro__:
+        if cls in KIND_CODES:
+            return KIND_CODES[cls]
+    raise TypeError(f'object of type {musician.__class__.__name__} is not a musician')
+
+
+def create_musician(kind, name, is_band_member=True, vocals=None, instrument=None):
+    """Creates a musician of the given kind (a class from KINDS) from the values of its data fields;
+    vocals are used only for singers, and instrument only for songwriters.
+    """
+
+    kwargs = {'name': name, 'is_band_member': is_band_member}
+    if issubclass(kind, Singer):
+        kwargs['vocals'] = vocals
+    if issubclass(kind, Songwriter):
+        kwargs['instrument'] = instrument
+    return kind(**kwargs)
+
+
+def slotted_musician_py_to_json(musician, compact=False):
+    """Returns the dict of the fields of a SlottedMusician object (or an object of one of its subclasses).
+    Slotted objects have no __dict__, so the fields are collected from the fields class variable instead.
+    Enum values (vocals, instrument) are encoded by enum_py_to_json().
+    """
+
+    d = {field: getattr(musician, field) for field in musician.fields}
+    for field in ENUM_FIELDS.keys() & d.keys():
+        d[field] = enum_py_to_json(d[field], compact)
+    return d
+
+
+def slotted_musician_json_to_py(cls, musician_dict):
+    """Creates an object of cls (SlottedMusician or one of its subclasses) from the dict of its fields,
+    as returned by slotted_musician_py_to_json().
+    """
+
+    kwargs = dict(musician_dict)
+    for field in ENUM_FIELDS.keys() & kwargs.keys():
+        kwargs[field] = enum_json_to_py(ENUM_FIELDS[field], kwargs[field])
+    return cls(**kwargs)
+
+
+def benchmark_slotted_musicians(n=100_000):
+    """Compares each class of the Musician hierarchy with its slotted counterpart,
+    creating n objects of each class.
+    Returns a list of 3-tuples (<class name>, <bytes per object>, <objects created per second>).
+    Bytes per object include the data fields, but not the name strings (they are shared by both variants).
+    """
+
+    names = [f'Musician {i}' for i in range(n)]
+    factories = [
+        (Musician, lambda name: Musician(name, is_band_member=False)),
+        (SlottedMusician, lambda name: SlottedMusician(name, is_band_member=False)),
+        (Singer, lambda name: Singer(name=name, vocals=Vocals.LEAD_VOCALS)),
+        (SlottedSinger, lambda name: SlottedSinger(name=name, vocals=Vocals.LEAD_VOCALS)),
+        (Songwriter, lambda name: Songwriter(name=name, instrument=Instrument.BASS)),
+        (SlottedSongwriter, lambda name: SlottedSongwriter(name=name, instrument=Instrument.BASS)),
+        (SingerSongwriter,
+         lambda name: SingerSongwriter(name=name, vocals=Vocals.LEAD_VOCALS, instrument=Instrument.BASS)),
+        (SlottedSingerSongwriter,
+         lambda name: SlottedSingerSongwriter(name=name, vocals=Vocals.LEAD_VOCALS, instrument=Instrument.BASS)),
+    ]
+
+    results = []
+    for cls, factory in factories:
+        _, size = measure_memory(lambda: [factory(name) for name in names])
+        seconds = measure_time(lambda: [factory(name) for name in names], repeat=3)
+        results.append((cls.__name__, size / n, n / seconds))
+    return results
+
+
 if __name__ == "__main__":
 
     # from testdata.musicians import *
@@ -352,3 +718,33 @@ if __name__ == "__main__":
     # print(the_beatles_py == the_beatles)
     #
     # print()
+
+    # # Demonstrate __slots__ (SlottedMusician and its subclasses): no __dict__, smaller objects
+    # lennon = SlottedSingerSongwriter(name='John Lennon',
+    #                                  vocals=Vocals.LEAD_VOCALS,
+    #                                  instrument=Instrument.RHYTHM_GUITAR,
+    #                                  is_band_member=True)
+    # print(lennon)
+    # # print(lennon.__dict__)                # AttributeError, slotted objects have no __dict__
+    # lennon_json = json.dumps(lennon, cls=MusicianEncoder)
+    # print(lennon_json)
+    # print(json.loads(lennon_json, object_hook=musician_json_to_py) == lennon)
+    # print()
+
+    # # Demonstrate JSON encoding/decoding of the subclasses of Musician (enum values encoded by name or by code)
+    # lennon = SingerSongwriter(name='John Lennon',
+    #                           vocals=Vocals.LEAD_VOCALS,
+    #                           instrument=Instrument.RHYTHM_GUITAR,
+    #                           is_band_member=True)
+    # lennon_json = json.dumps(lennon, default=musician_py_to_json)
+    # print(lennon_json)
+    # print(json.loads(lennon_json, object_hook=musician_json_to_py))
+    # roster_json = json.dumps(musicians_py_to_json([lennon, johnLennon]))
+    # print(roster_json)
+    # print(musicians_json_to_py(json.loads(roster_json)) == [lennon, johnLennon])
+    # for encoding, (size, seconds) in benchmark_musician_codec().items():
+    #     print(f'{encoding:25}{size:12,} bytes{seconds:10.4f} s')
+    # print()
+    # for class_name, bytes_per_object, objects_per_second in benchmark_slotted_musicians():
+    #     print(f'{class_name:25}{bytes_per_object:10.1f} bytes/object{objects_per_second:15,.0f} objects/s')
+    # print()
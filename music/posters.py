@@ -0,0 +1,166 @@
+"""Bulk downloading of the posters of movies (e.g., the poster links collected by crawl.get_m_info()).
+Posters are stored by the hash of their content (content-addressed storage), so identical images are stored once.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+import json
+import os
+from pathlib import PurePosixPath
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+
+from music.crawl import get_session, create_session
+from music.standin import StandInServer
+from util import utility
+
+# File name suffixes of the stored posters, by the Content-Type of the responses
+POSTER_SUFFIXES = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif', 'image/webp': '.webp'}
+
+
+def get_poster_suffix(url, content_type=None):
+    """Returns the file name suffix for a poster downloaded from url, based on content_type (the Content-Type
+    of the response) if it is an image type, and on the URL otherwise.
+    """
+
+    suffix = POSTER_SUFFIXES.get((content_type if content_type else '').split(';')[0].strip())
+    return suffix if suffix else PurePosixPath(urlsplit(url).path).suffix.lower()
+
+
+class PosterStore:
+    """The class describing a directory of posters (by default, data/posters), stored by their content:
+    each poster is stored in a file named after the SHA-256 hash of the image, so identical images downloaded
+    from different links are stored just once.
+    The index file (index.jsonl, one {"url": ..., "file": ...} object per line) maps the links to the files;
+    it is appended to right after each poster is stored, so the posters downloaded before an interruption
+    are known when the store is opened again.
+    """
+
+    def __init__(self, directory='posters'):
+        self.directory = utility.get_data_file(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.directory / 'index.jsonl'
+        self.index = {}
+        self.__lock = Lock()
+        if self.index_file.exists():
+            with open(self.index_file, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue                            # e.g., the last line, cut off by an interruption
+                    if (self.directory / entry['file']).exists():
+                        self.index[entry['url']] = entry['file']
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, url):
+        return url in self.index
+
+    def __str__(self):
+        return f'Poster store {self.directory}: {len(self)} links, {len(set(self.index.values()))} files'
+
+    def get_file(self, url):
+        """Returns the Path object of the stored poster downloaded from url, or None if there is none.
+        """
+
+        file_name = self.index.get(url)
+        return self.directory / file_name if file_name else None
+
+    def add(self, url, content, content_type=None):
+        """Stores the poster content (bytes) downloaded from url, unless the same image is already stored,
+        and records it in the index. Returns the Path object of the file.
+        """
+
+        file_name = sha256(content).hexdigest() + get_poster_suffix(url, content_type)
+        file = self.directory / file_name
+        with self.__lock:
+            if not file.exists():
+                temp_file = self.directory / f'{file_name}.tmp'
+                temp_file.write_bytes(content)
+                os.replace(temp_file, file)                 # an interruption never leaves a partial poster
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'url': url, 'file': file_name}) + '\n')
+            self.index[url] = file_name
+        return file
+
+
+def download_poster(store, url, session):
+    """Downloads the poster from url through session and adds it to store (a PosterStore object).
+    Returns a 2-tuple (url, <Path object of the stored poster, or None if the download failed>).
+    """
+
+    try:
+        response = session.get(url, timeout=30)
+    except requests.RequestException:
+        return url, None
+    if response.status_code != 200:
+        return url, None
+    return url, store.add(url, response.content, response.headers.get('Content-Type'))
+
+
+def download_posters(poster_links, directory='posters', max_workers=8, session=None):
+    """Downloads the posters from poster_links (e.g., the last items of the tuples returned by crawl.get_m_info())
+    concurrently, with up to max_workers downloads in flight, through session (by default, the shared session;
+    see crawl.get_session()), and stores them in a PosterStore in directory.
+    Repeated links are downloaded once, and the links already in the store are not downloaded at all,
+    so running it again after an interruption resumes the download, and failed downloads are retried.
+    Returns a dict {<link>: <Path object of the stored poster, or None if the download failed>}.
+    """
+
+    store = PosterStore(directory)
+    links = list(dict.fromkeys(link for link in poster_links if link))     # unique links, in order; no None
+    results = {link: store.get_file(link) for link in links if link in store}
+    pending = [link for link in links if link not in results]
+    session = session if session else get_session()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for url, file in executor.map(lambda link: download_poster(store, link, session), pending):
+            results[url] = file
+    return results
+
+
+def benchmark_posters(n_posters=200, latency=0.02, max_workers=8):
+    """Downloads n_posters posters from a local stand-in server (music.standin) that responds after latency seconds,
+    first one at a time, then with up to max_workers downloads in flight, and then again (all skipped, as in
+    a resumed run). The n_posters links have only 64 different images (see music.standin.StandInServer.get_poster()).
+    Returns a dict: {<download mode>: (<time in seconds>, <number of files stored>)}.
+    """
+
+    results = {}
+    with StandInServer(latency=latency, n_pages=1) as server, create_session(pool_maxsize=max_workers) as session:
+        links = [f'{server.base_url}posters/{i}.jpg' for i in range(n_posters)]
+        for mode, workers, directory in (('sequential', 1, 'benchmark_posters_1'),
+                                         (f'{max_workers} workers', max_workers, 'benchmark_posters_n'),
+                                         ('resumed', max_workers, 'benchmark_posters_n')):
+            seconds = utility.measure_time(download_posters, links, directory, workers, session, repeat=1)
+            results[mode] = (seconds, len(list(utility.get_data_file(directory).glob('*.jpg'))))
+    for directory in ('benchmark_posters_1', 'benchmark_posters_n'):
+        directory = utility.get_data_file(directory)
+        for file in directory.iterdir():
+            file.unlink()
+        directory.rmdir()
+    return results
+
+
+if __name__ == "__main__":
+
+    from music.crawl import get_m_info
+
+    # Download the posters of the movies from a synthetic movie list on the local stand-in server
+    # (into data/posters_demo, removed afterwards)
+    with StandInServer(n_pages=2) as server:
+        movies = get_m_info(server.start_url, max_pages=2)
+        posters = download_posters((poster_link for *_, poster_link in movies), 'posters_demo')
+        store = PosterStore('posters_demo')
+        print(f'{len(movies)} movies, {len(posters)} poster links, {store}')
+    for file in store.directory.iterdir():
+        file.unlink()
+    store.directory.rmdir()
+    print()
+
+    # # Benchmark
+    # for mode, (seconds, n_files) in benchmark_posters().items():
+    #     print(f'{mode:12}{seconds:8.2f} s{n_files:6} files')
@@ -0,0 +1,224 @@
+"""Adaptive per-host rate limiting of the crawler's requests, with retries and jittered exponential backoff.
+The limiter plugs into requests as a transport adapter (see RateLimitedAdapter and crawl.create_session()).
+"""
+
+from email.utils import parsedate_to_datetime
+import random
+from threading import Condition, Lock
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from music.httpcache import CachingAdapter
+
+# Response status codes that mean that the server is overloaded or throttling the client
+THROTTLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+def get_retry_after(response):
+    """Returns the number of seconds from the Retry-After header of response (in seconds or an HTTP date),
+    or None if there is no such header.
+    """
+
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimiter:
+    """The class describing the limits of the requests to one host: a token bucket that allows up to rate requests
+    per second (with bursts of up to burst requests), and a limit of concurrency requests in flight.
+    Both limits are adapted to the responses (AIMD, as in TCP congestion control): they grow fast (each OK response
+    adds 1 to the rate, "slow start") until the server throttles the client for the first time, then slowly
+    while the responses are OK and fast enough, and are cut by half whenever the server throttles the client
+    (429/5xx responses, or failed connections). The concurrency is also reduced a little when the responses
+    are slower than latency_target seconds. A Retry-After header stops all requests to the host for that long.
+    """
+
+    def __init__(self, rate=5.0, burst=5, concurrency=4.0, min_rate=0.5, max_rate=200.0, max_concurrency=32.0,
+                 latency_target=2.0):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.tokens = float(burst)
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self.slow_start = True
+        self.__updated = time.monotonic()
+        self.__condition = Condition()
+
+    def __str__(self):
+        return f'{self.rate:.1f} requests/s, {self.concurrency:.1f} in flight, ' \
+               f'{self.successes} OK, {self.throttled} throttled'
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.__updated) * self.rate)
+        self.__updated = now
+
+    def acquire(self):
+        """Blocks until a request to the host is allowed (there is a token, and less than concurrency requests
+        are in flight), and then takes a token and a place in flight.
+        """
+
+        with self.__condition:
+            while True:
+                self.__refill()
+                if self.in_flight < max(1, int(self.concurrency)):
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return
+                    self.__condition.wait((1 - self.tokens) / self.rate)
+                else:
+                    self.__condition.wait()
+
+    def release(self, latency=None, throttled=False, retry_after=None, failed=False):
+        """Gives back the place in flight taken by acquire(), and adapts the limits to the response,
+        which took latency seconds, or failed, if throttled is True (possibly with a Retry-After header).
+        If failed is True (the request failed for a reason that says nothing about the server's load,
+        e.g. an invalid header), only the place in flight is given back.
+        """
+
+        with self.__condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.slow_start = False
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.concurrency = max(1.0, self.concurrency / 2)
+                self.__refill()
+                self.tokens = min(self.tokens, -(retry_after if retry_after else 0) * self.rate)
+            elif not failed:
+                self.successes += 1
+                if latency is not None and latency > self.latency_target:
+                    self.concurrency = max(1.0, self.concurrency * 0.9)
+                else:
+                    self.rate = min(self.max_rate, self.rate + (1 if self.slow_start else 1 / self.rate))
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self.__condition.notify_all()
+
+
+class RateLimiter:
+    """The class describing the rate limits of the requests to all hosts (a HostLimiter per host, created
+    with host_kwargs on the first request to the host), and the retries of the throttled requests:
+    up to max_retries times, after a random time between 0 and min(max_backoff, backoff * 2 ** <attempt>) seconds
+    ("full jitter" exponential backoff), so that the retries of concurrent requests don't come in bursts.
+    The limiter also counts the pages (OK responses) and reports the pages per second achieved.
+    """
+
+    def __init__(self, max_retries=5, backoff=0.5, max_backoff=30.0, **host_kwargs):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.host_kwargs = host_kwargs
+        self.hosts = {}
+        self.retries = 0
+        self.start = None
+        self.__lock = Lock()
+
+    def __str__(self):
+        return f'Rate limiter: {self.pages_per_second():.1f} pages/s, {self.retries} retries; ' + \
+            '; '.join(f'{host}: {limiter}' for host, limiter in self.hosts.items())
+
+    def get_host_limiter(self, host):
+        with self.__lock:
+            if self.start is None:
+                self.start = time.perf_counter()
+            if host not in self.hosts:
+                self.hosts[host] = HostLimiter(**self.host_kwargs)
+            return self.hosts[host]
+
+    def retry(self, attempt):
+        """Counts a retry after the attempt-th attempt (starting from 0) and returns the backoff time in seconds.
+        """
+
+        with self.__lock:
+            self.retries += 1
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def pages_per_second(self):
+        """Returns the number of OK responses per second since the first request.
+        """
+
+        if self.start is None:
+            return 0.0
+        return sum(limiter.successes for limiter in self.hosts.values()) / (time.perf_counter() - self.start)
+
+    def report(self):
+        """Returns a dict with the pages per second achieved, the number of retries,
+        and the current limits and counts for each host.
+        """
+
+        return {'pages_per_second': self.pages_per_second(), 'retries': self.retries,
+                'hosts': {host: {'rate': limiter.rate, 'concurrency': limiter.concurrency,
+                                 'successes': limiter.successes, 'throttled': limiter.throttled}
+                          for host, limiter in self.hosts.items()}}
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """Transport adapter that sends requests within the limits of a RateLimiter, and retries the throttled ones
+    (429/5xx responses, failed connections and timeouts); after max_retries, the last response is returned
+    (or the last exception is raised). The kwargs (e.g., pool_maxsize) are passed to HTTPAdapter.
+    """
+
+    def __init__(self, limiter, **kwargs):
+        super().__init__(**kwargs)
+        self.limiter = limiter
+
+    def send(self, request, **kwargs):
+        host_limiter = self.limiter.get_host_limiter(urlsplit(request.url).netloc)
+        for attempt in range(self.limiter.max_retries + 1):
+            host_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                host_limiter.release(throttled=True)
+                if attempt == self.limiter.max_retries:
+                    raise
+            except BaseException:                           # e.g., InvalidHeader: not retried, but the place is freed
+                host_limiter.release(failed=True)
+                raise
+            else:
+                throttled = response.status_code in THROTTLE_STATUSES
+                retry_after = get_retry_after(response) if throttled else None
+                host_limiter.release(time.perf_counter() - start, throttled, retry_after)
+                if not throttled or attempt == self.limiter.max_retries:
+                    return response
+                response.close()
+            time.sleep(self.limiter.retry(attempt))
+
+
+class CachingRateLimitedAdapter(CachingAdapter, RateLimitedAdapter):
+    """Transport adapter that serves requests from a ResponseCache when possible (see CachingAdapter),
+    and sends the others within the limits of a RateLimiter (see RateLimitedAdapter).
+    """
+
+    def __init__(self, cache, limiter, **kwargs):
+        super().__init__(cache, limiter=limiter, **kwargs)
+
+
+if __name__ == "__main__":
+
+    from music.crawl import benchmark_rate_limit
+
+    # Crawl a local stand-in server that throttles the clients that send more than 20 requests per second
+    for max_in_flight, report in benchmark_rate_limit().items():
+        print(f'{max_in_flight:3} in flight: {report["pages_per_second"]:6.1f} pages/s, '
+              f'{report["retries"]} retries, {report["throttled"]} throttled')
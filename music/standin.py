@@ -0,0 +1,257 @@
+"""Local stand-in for the IMDb website, for testing and benchmarking the crawler without network access.
+http.server documentation: https://docs.python.org/3/library/http.server.html
+"""
+
+import email.utils
+import gzip
+from hashlib import sha1
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import random
+import sys
+from collections import deque
+from threading import Lock, Thread
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from util.utility import get_data_dir
+
+LISTING_PATH = 'search/keyword/?keywords=rock-%27n%27-roll%2Crock-music&ref_=kw_ref_key&mode=detail&page=1&' \
+               'sort=moviemeter,asc'
+
+# Templates of synthetic listing pages (see synthetic_page()), with the structure of the IMDb pages (data/soup.html)
+SYNTHETIC_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Synthetic movie list, page {page}</title></head>
+<body><div class="lister-list">
+{items}</div>
+<h3>Recently Viewed</h3>
+</body></html>
+"""
+SYNTHETIC_ITEM = """<div class="lister-item mode-detail">
+<div class="lister-item-image ribbonize" data-tconst="{tconst}">
+<a href="/title/{tconst}/"><img alt="{title}" class="loadlate" loadlate="{poster}" src="/nopicture.png"/></a>
+</div>
+<div class="lister-item-content">
+<h3 class="lister-item-header">
+<span class="lister-item-index unbold text-primary">{index}.</span>
+<a href="/title/{tconst}/">{title}</a>
+<span class="lister-item-year text-muted unbold">{year}</span>
+</h3>
+<p class="text-muted text-small"><span class="genre">Music</span></p>
+</div>
+</div>
+"""
+
+
+def synthetic_page(page, items_per_page=50, n_items=None, poster_url='https://m.media-amazon.com/images/M/'):
+    """Returns the HTML text of the page-th page (starting from 1) of a synthetic IMDb movie list
+    with n_items movies (by default, unlimited) shown items_per_page per page.
+    The pages after the last movie have no movies. The raw years vary like on IMDb ('(1984)', '(I) (2019)',
+    '(2006–2013)', '(1979 TV Movie)'), and the poster links (poster_url + <poster>.jpg) repeat every 97 movies.
+    """
+
+    first = (page - 1) * items_per_page
+    last = first + items_per_page if n_items is None else min(first + items_per_page, n_items)
+    items = []
+    for i in range(first, last):
+        year = 1950 + i % 70
+        raw_year = f'(I) ({year})' if i % 7 == 3 else f'({year}–{year + 3})' if i % 11 == 5 else \
+            f'({year} TV Movie)' if i % 13 == 8 else f'({year})'
+        items.append(SYNTHETIC_ITEM.format(tconst=f'tt{i + 1:07}', title=escape(f'Synthetic Movie {i + 1}'),
+                                           poster=f'{poster_url}{i % 97}.jpg', index=i + 1, year=raw_year))
+    return SYNTHETIC_PAGE.format(page=page, items=''.join(items))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Handles GET requests to the stand-in server: each request is answered with the requested page
+    (see StandInServer.get_page()), after the server's latency (in seconds) has passed,
+    or with 503 Service Unavailable (with the probability of the server's error rate),
+    or with 429 Too Many Requests (if the server's max rate is exceeded).
+    HTTP/1.1 is used, so that clients can keep connections alive, and the page is gzip-compressed
+    if the client accepts it. The page is sent with ETag and Last-Modified headers, and conditional requests
+    (If-None-Match, If-Modified-Since) for an unchanged page are answered with 304 Not Modified.
+    The server counts the connections it has accepted and the requests it has answered.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True              # no delayed small writes (e.g., the body after the headers)
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.server.count('requests_count')
+        if self.server.is_throttled():
+            self.server.count('throttled_count')
+            self.send_page(b'Too Many Requests', status=429, headers={'Retry-After': '1'})
+            return
+        if self.server.error_rate and self.server.random.random() < self.server.error_rate:
+            self.server.count('errors_count')
+            self.send_page(b'Service Unavailable', status=503, headers={'Retry-After': '1'})
+            return
+        if urlsplit(self.path).path.startswith('/posters/'):
+            poster = self.server.get_poster(self.path)
+            if poster is None:
+                self.send_page(b'Not Found', status=404)
+            else:
+                self.send_page(poster, content_type='image/jpeg')
+            return
+        page, etag = self.server.get_page(self.path)
+        last_modified = self.server.last_modified
+        if self.headers.get('If-None-Match') == etag or \
+                'If-None-Match' not in self.headers and self.headers.get('If-Modified-Since') == last_modified:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_page(page, headers={'ETag': etag, 'Last-Modified': last_modified})
+
+    def send_page(self, body, status=200, headers=None, content_type='text/html; charset=utf-8'):
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and not content_type.startswith('image/'):
+            body = gzip.compress(body, compresslevel=1)
+            headers = {**(headers if headers else {}), 'Content-Encoding': 'gzip'}
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers if headers else {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass                                    # no logging of each request to stderr
+
+
+class StandInServer(ThreadingHTTPServer):
+    """The class describing a local HTTP server that stands in for IMDb.
+    By default, it answers every request with data/soup.html (a saved IMDb listing page).
+    If n_pages is given, it serves a synthetic movie list instead (see synthetic_page()): n_pages pages
+    of items_per_page movies each, selected by the page parameter of the URL. The posters of the synthetic movies
+    are served by the server too, from /posters/<poster>.jpg (see get_poster()).
+    Each request fails with 503 Service Unavailable with the probability error_rate (random, but reproducible
+    for the same seed if the requests are sent one at a time).
+    If max_rate is given, the requests that exceed max_rate requests in the last second are answered with
+    429 Too Many Requests, like a server that throttles its clients.
+    Use it as a context manager, which starts the server in a background thread and shuts it down at the end:
+        with StandInServer(latency=0.2) as server:
+            get_m_info(server.start_url, max_pages=5)
+        with StandInServer(latency=0.05, n_pages=100, error_rate=0.01) as server:
+            ...
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, port=0, page_file=None, n_pages=None, items_per_page=50, error_rate=0.0, seed=0,
+                 max_rate=None):
+        super().__init__(('127.0.0.1', port), StandInHandler)
+        self.latency = latency
+        self.n_pages = n_pages
+        self.items_per_page = items_per_page
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.pages = {}                                     # {<page number>: (<page>, <ETag>)}; 0 for page_file
+        if n_pages is None:
+            self.add_page(0, (page_file if page_file else get_data_dir() / 'soup.html').read_bytes())
+        self.last_modified = email.utils.formatdate(time.time(), usegmt=True)
+        self.connections = 0
+        self.requests_count = 0
+        self.errors_count = 0
+        self.max_rate = max_rate
+        self.throttled_count = 0
+        self.__request_times = deque()
+        self.__lock = Lock()
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):     # e.g., a keep-alive connection reset by the client
+            super().handle_error(request, client_address)
+
+    def count(self, counter):
+        """Adds 1 to the counter attribute (e.g., 'requests_count'); the handler threads update the counters
+        only through this method, so that no update is lost.
+        """
+
+        with self.__lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def is_throttled(self):
+        """Returns True if the current request exceeds max_rate requests in the last second
+        (the throttled requests don't count).
+        """
+
+        if self.max_rate is None:
+            return False
+        with self.__lock:
+            now = time.monotonic()
+            while self.__request_times and now - self.__request_times[0] > 1:
+                self.__request_times.popleft()
+            if len(self.__request_times) >= self.max_rate:
+                return True
+            self.__request_times.append(now)
+            return False
+
+    def add_page(self, page_number, page):
+        self.pages[page_number] = page, f'"{sha1(page).hexdigest()}"'
+        return self.pages[page_number]
+
+    def get_page(self, path):
+        """Returns a 2-tuple (<page (bytes)>, <ETag>) of the page for the request path:
+        the page file, or the synthetic page selected by the page parameter of path (see synthetic_page()).
+        """
+
+        if self.n_pages is None:
+            return self.pages[0]
+        try:
+            page_number = int(parse_qs(urlsplit(path).query).get('page', ['1'])[0])
+        except ValueError:
+            page_number = 1
+        if page_number in self.pages:
+            return self.pages[page_number]
+        n_items = self.n_pages * self.items_per_page
+        return self.add_page(page_number, synthetic_page(page_number, self.items_per_page, n_items,
+                                                         self.base_url + 'posters/').encode('utf-8'))
+
+    def get_poster(self, path):
+        """Returns the synthetic poster image (bytes) for the request path /posters/<poster>.jpg, or None.
+        The images are about 10 KB each, and posters whose numbers differ by 64 have the same image,
+        like the same poster reused by several movies on IMDb.
+        """
+
+        try:
+            poster = int(urlsplit(path).path.removeprefix('/posters/').removesuffix('.jpg'))
+        except ValueError:
+            return None
+        return b'\xff\xd8\xff\xe0' + sha1(str(poster % 64).encode('utf-8')).digest() * 512
+
+    def __enter__(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_port}/'
+
+    @property
+    def start_url(self):
+        """The URL of the first page of a multi-page movie list on the stand-in server.
+        """
+
+        return self.base_url + LISTING_PATH
+
+
+if __name__ == "__main__":
+
+    # Serve data/soup.html until interrupted (Ctrl+C)
+    with StandInServer(port=8000, latency=0.1) as server:
+        print(f'Serving at {server.start_url}')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -4,7 +4,9 @@
 from datetime import date
 import sys
 from pathlib import Path
-from pickle import dump, load
+from pickle import dump, load, dumps, loads
+import copy
+import copyreg
 
 from music.musician import *
 from music.band import *
@@ -40,6 +42,29 @@ class Studio:
     def __eq__(self, other):
         return isinstance(other, Studio) and self.__dict__ == other.__dict__
 
+    # Pickling support: the minimal state (a tuple of the data fields, without their names) for Studio objects
+    # that have exactly these fields; objects of the subclasses of Studio and objects with other fields set on them
+    # are pickled with their __dict__
+    pickle_fields = ('name', 'location', 'start_date', 'end_date', 'bands')
+
+    def __getstate__(self):
+        d = self.__dict__
+        if type(self) is Studio and len(d) == len(Studio.pickle_fields):
+            try:
+                return d['name'], d['location'], d['start_date'], d['end_date'], d['bands']
+            except KeyError:
+                pass
+        return d
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            self.__dict__.update(state)
+        else:
+            self.name, self.location, self.start_date, self.end_date, self.bands = state
+
+    def __reduce_ex__(self, protocol):
+        return copyreg.__newobj__, (type(self),), self.__getstate__()
+
 
 class StudioError(Exception):
     """Base class for exceptions in this module.
@@ -113,6 +138,99 @@ def studio_json_to_py(studio_json):
     return studio_json
 
 
+class BaselineMusician:
+    """Musician as it is pickled by default, without __getstate__()/__reduce_ex__(): a plain class whose objects
+    are given the __dict__ of Musician objects; used as the baseline in benchmark_pickle().
+    """
+
+
+class BaselineBand:
+    """Band as it is pickled by default (see BaselineMusician).
+    """
+
+
+class BaselineStudio:
+    """Studio as it is pickled by default (see BaselineMusician).
+    """
+
+
+def to_baseline(studio):
+    """Returns a BaselineStudio object with the same state (__dict__) as studio, and with its bands and their members
+    converted to BaselineBand and BaselineMusician objects the same way.
+    """
+
+    def convert(o, cls, **fields):
+        b = cls.__new__(cls)
+        b.__dict__.update(o.__dict__, **fields)
+        return b
+
+    bands = tuple(convert(band, BaselineBand, members=tuple(convert(m, BaselineMusician) for m in band.members))
+                  for band in studio.bands)
+    return convert(studio, BaselineStudio, bands=bands)
+
+
+def check_pickle_round_trips(protocol=5):
+    """Checks that pickling (and copy.deepcopy(), which uses __reduce_ex__() too) keeps all the data fields
+    of the objects that don't get the minimal state: objects of subclasses with more fields, objects with
+    more fields set on them, and objects that lack some of their class's fields.
+    Raises AssertionError if a round trip loses or changes a field.
+    """
+
+    class Guitarist(Musician):
+        def __init__(self, guitar, **kwargs):
+            super().__init__(**kwargs)
+            self.guitar = guitar
+
+    class Label(Studio):
+        def __init__(self, label, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.label = label
+
+    nickname = Musician('Ringo Starr')
+    nickname.nickname = 'Ringo'
+    no_writes_songs = SingerSongwriter(name='Nick Cave', vocals=Vocals.LEAD_VOCALS, instrument=Instrument.PIANO)
+    del no_writes_songs.writes_songs
+    slotted = SlottedSinger(name='Dolores', vocals=Vocals.LEAD_VOCALS)
+    slotted.instrument = Instrument.RHYTHM_GUITAR
+    band = Band('The Beatles', nickname, no_writes_songs, formed=date(1962, 8, 18), split=date(1970, 4, 10))
+    band.label = 'Apple'
+    studio = Studio('Abbey Road', 'London', band)
+    for o in (nickname, no_writes_songs, band, studio):
+        assert loads(dumps(o, protocol)).__dict__.keys() == o.__dict__.keys()
+        assert copy.deepcopy(o).__dict__.keys() == o.__dict__.keys()
+    assert loads(dumps(slotted, protocol)).instrument == slotted.instrument
+    for o in (Guitarist('Rickenbacker', name='John Lennon'),
+              Label('EMI', 'Abbey Road', 'London', band, start_date=date(1962, 1, 1))):
+        copied = copy.deepcopy(o)
+        assert type(copied) is type(o) and copied.__dict__.keys() == o.__dict__.keys()
+    return True
+
+
+def benchmark_pickle(n_bands=10_000, n_members=5, protocol=5):
+    """Compares pickling a studio of n_bands bands (n_members musicians each) as it is pickled by default,
+    i.e. the same data in classes without __getstate__()/__reduce_ex__() (see to_baseline()),
+    and with the minimal state defined by __reduce_ex__()/__getstate__(); both are unpickled with pickle.loads().
+    A band iterated over before pickling carries its iterator counter in __dict__, so half of the bands are.
+    Returns a dict: {<state>: (<pickle size in bytes>, <dumps() + loads() time in seconds>)}.
+    """
+
+    bands = [Band(f'Band {i}', *[Musician(f'Musician {i}-{j}') for j in range(n_members)],
+                  formed=date(1962, 1 + i % 12, 1 + i % 28), split=date(1970, 4, 10))
+             for i in range(n_bands)]
+    for band in bands[::2]:
+        list(band)
+    studio = Studio('Abbey Road', 'London', *bands, start_date=date(1962, 1, 1), end_date=date(1970, 12, 31))
+    baseline = to_baseline(studio)
+
+    assert check_pickle_round_trips(protocol)
+    loaded = loads(dumps(baseline, protocol))
+    assert [[m.__dict__ for m in band.members] for band in loaded.bands] == \
+        [[m.__dict__ for m in band.members] for band in studio.bands]
+    assert loads(dumps(studio, protocol)) == studio
+    return {'default': (len(dumps(baseline, protocol)), measure_time(lambda: loads(dumps(baseline, protocol)))),
+            'minimal state': (len(dumps(studio, protocol)), measure_time(lambda: loads(dumps(studio, protocol))))}
+
+
 if __name__ == "__main__":
 
     from testdata.musicians import *
@@ -228,6 +346,15 @@ if __name__ == "__main__":
     # Demonstrate get_project_dir(), get_data_dir() and writing/reading to/from files in data dir
     print()
 
+    # # Demonstrate pickling with minimal state (__getstate__()/__setstate__()), e.g. for multiprocessing workers
+    # the_beatles = Band('The Beatles', *[johnLennon, paulMcCartney, georgeHarrison, ringoStarr],
+    #                    formed=date(1962, 8, 18), split=date(1970, 4, 10))
+    # abbey_road = Studio('Abbey Road', 'London', the_beatles, start_date=date(1967, 1, 1), end_date=date(1967, 12, 31))
+    # print(loads(dumps(abbey_road, protocol=5)) == abbey_road)
+    # for state, (size, seconds) in benchmark_pickle().items():
+    #     print(f'{state:15}{size:12,} bytes{seconds:10.4f} s')
+    # print()
+
     # Demonstrate JSON encoding/decoding of Studio objects
     # Single object
     the_beatles = Band('The Beatles', *[johnLennon, paulMcCartney, georgeHarrison, ringoStarr],
@@ -0,0 +1,184 @@
+"""Columnar representation of large rosters of musicians.
+NumPy documentation: https://numpy.org/doc/stable/
+"""
+
+import random
+
+import numpy as np
+
+from music.enums import Vocals, Instrument
+from music.musician import Singer, Songwriter, SingerSongwriter, \
+    KINDS, get_kind_code, create_musician
+from util.utility import measure_time
+
+# Enum values are stored as small ints; 0 stands for None (e.g., the vocals of a Songwriter)
+VOCALS = (None, *Vocals)
+INSTRUMENTS = (None, *Instrument)
+VOCALS_CODES = {v: code for code, v in enumerate(VOCALS)}
+INSTRUMENT_CODES = {i: code for code, i in enumerate(INSTRUMENTS)}
+
+
+class MusicianTable:
+    """The class describing a roster of musicians stored column by column, instead of as a list of objects.
+    Each column is a NumPy array:
+    - name_ids - indices into the names list (each distinct name is stored only once)
+    - is_band_member - bool
+    - vocals - codes of Vocals values (see VOCALS; 0 means no vocals)
+    - instrument - codes of Instrument values (see INSTRUMENTS; 0 means no instrument)
+    - kind - codes of the classes of musicians (see KINDS)
+    Filters are evaluated on whole columns at once, producing boolean masks that can be combined with &, | and ~.
+    """
+
+    def __init__(self, names, name_ids, is_band_member, vocals, instrument, kind):
+        self.names = names
+        self.name_ids = np.asarray(name_ids, dtype=np.int32)
+        self.is_band_member = np.asarray(is_band_member, dtype=np.bool_)
+        self.vocals = np.asarray(vocals, dtype=np.int8)
+        self.instrument = np.asarray(instrument, dtype=np.int8)
+        self.kind = np.asarray(kind, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.name_ids)
+
+    def __getitem__(self, i):
+        return self.get_musician(i)
+
+    def __iter__(self):
+        return (self.get_musician(i) for i in range(len(self)))
+
+    def __str__(self):
+        counts = ', '.join(f'{cls.__name__}: {np.count_nonzero(self.kind == code)}' for code, cls in enumerate(KINDS))
+        return f'MusicianTable of {len(self)} musicians ({counts})'
+
+    def __eq__(self, other):
+        return isinstance(other, MusicianTable) and list(self) == list(other)
+
+    # Alternative constructor
+    @classmethod
+    def from_musicians(cls, musicians):
+        """Builds the table from an iterable of Musician objects
+        (or objects of its subclasses, or of the slotted classes).
+        """
+
+        names = []
+        name_index = {}
+        name_ids, is_band_member, vocals, instrument, kind = [], [], [], [], []
+        for m in musicians:
+            name_id = name_index.get(m.name)
+            if name_id is None:
+                name_id = name_index[m.name] = len(names)
+                names.append(m.name)
+            name_ids.append(name_id)
+            is_band_member.append(m.is_band_member)
+            vocals.append(VOCALS_CODES[getattr(m, 'vocals', None)])
+            instrument.append(INSTRUMENT_CODES[getattr(m, 'instrument', None)])
+            kind.append(get_kind_code(m))
+        return cls(names, name_ids, is_band_member, vocals, instrument, kind)
+
+    def get_musician(self, i):
+        """Materializes the i-th row of the table as an object of the corresponding class of musicians.
+        """
+
+        return create_musician(KINDS[self.kind[i]], self.names[self.name_ids[i]], bool(self.is_band_member[i]),
+                               VOCALS[self.vocals[i]], INSTRUMENTS[self.instrument[i]])
+
+    def to_musicians(self, mask=None):
+        """Materializes the rows selected by the boolean mask (all rows if mask is None) as a list of musicians.
+        """
+
+        indices = range(len(self)) if mask is None else np.flatnonzero(mask)
+        return [self.get_musician(i) for i in indices]
+
+    def where(self, name=None, is_band_member=None, vocals=None, instrument=None, kind=None):
+        """Returns the boolean mask of the rows that satisfy all of the specified conditions
+        (the conditions left as None are not checked). A call example (solo musicians who play bass):
+            <table>.where(is_band_member=False, instrument=Instrument.BASS)
+        kind is one of the classes from KINDS; rows of its subclasses match as well (e.g., Singer matches
+        SingerSongwriter rows), as with isinstance().
+        """
+
+        mask = np.ones(len(self), dtype=np.bool_)
+        if name is not None:
+            mask &= self.name_ids == (self.names.index(name) if name in self.names else -1)
+        if is_band_member is not None:
+            mask &= self.is_band_member == is_band_member
+        if vocals is not None:
+            mask &= self.vocals == VOCALS_CODES[vocals]
+        if instrument is not None:
+            mask &= self.instrument == INSTRUMENT_CODES[instrument]
+        if kind is not None:
+            mask &= np.isin(self.kind, [code for code, cls in enumerate(KINDS) if issubclass(cls, kind)])
+        return mask
+
+    def count(self, **conditions):
+        """Returns the number of rows that satisfy the conditions (keyword arguments of where()).
+        """
+
+        return int(np.count_nonzero(self.where(**conditions)))
+
+    def select(self, mask):
+        """Returns a new MusicianTable with the rows selected by the boolean mask.
+        The names list is shared with this table, not copied.
+        """
+
+        return MusicianTable(self.names, self.name_ids[mask], self.is_band_member[mask],
+                             self.vocals[mask], self.instrument[mask], self.kind[mask])
+
+
+def generate_roster(n, random_seed=0):
+    """Generates a list of n random musicians (objects of the classes from KINDS), for testing and benchmarking.
+    """
+
+    rng = random.Random(random_seed)                   # the global random state is left alone
+    roster = []
+    for i in range(n):
+        kind = rng.choice(KINDS)
+        kwargs = {'name': f'Musician {i}', 'is_band_member': rng.random() < 0.7}
+        if kind in (Singer, SingerSongwriter):
+            kwargs['vocals'] = rng.choice(list(Vocals))
+        if kind in (Songwriter, SingerSongwriter):
+            kwargs['instrument'] = rng.choice(list(Instrument))
+        roster.append(kind(**kwargs))
+    return roster
+
+
+def benchmark_musician_table(n=1_000_000):
+    """Counts solo musicians who play bass in a roster of n random musicians,
+    using a Python-level scan of the list of objects and using MusicianTable.count().
+    Returns a 2-tuple (<list scan time>, <table count time>), in seconds.
+    """
+
+    roster = generate_roster(n)
+    table = MusicianTable.from_musicians(roster)
+
+    def scan():
+        return sum(1 for m in roster
+                   if not m.is_band_member and getattr(m, 'instrument', None) == Instrument.BASS)
+
+    assert scan() == table.count(is_band_member=False, instrument=Instrument.BASS)
+    return (measure_time(scan, repeat=3),
+            measure_time(table.count, repeat=3, is_band_member=False, instrument=Instrument.BASS))
+
+
+if __name__ == "__main__":
+
+    from testdata.musicians import *
+
+    # Build a MusicianTable from Musician objects and materialize it back
+    lennon = SingerSongwriter(name='John Lennon', vocals=Vocals.LEAD_VOCALS, instrument=Instrument.RHYTHM_GUITAR)
+    mccartney = SingerSongwriter(name='Paul McCartney', vocals=Vocals.LEAD_VOCALS, instrument=Instrument.BASS)
+    table = MusicianTable.from_musicians([lennon, mccartney, georgeHarrison, ringoStarr, nickCave, bobDylan])
+    print(table)
+    for musician in table:
+        print(musician)
+    print()
+
+    # Vectorized filtering and counting
+    print(table.count(is_band_member=False))
+    print(*table.to_musicians(table.where(instrument=Instrument.BASS)), sep='\n')
+    print(table.select(table.where(kind=Singer) | ~table.is_band_member))
+    print()
+
+    # # Benchmark
+    # scan_time, table_time = benchmark_musician_table()
+    # print(f'list scan: {scan_time:.4f} s, MusicianTable.count(): {table_time:.4f} s')
@@ -3,7 +3,11 @@
 
 from enum import Enum
 from datetime import date
+import gc
 import json
+from pathlib import Path
+import time
+import tracemalloc
 
 from settings import *
 
@@ -52,6 +56,65 @@ def get_data_dir():
     return data_dir
 
 
+def get_data_file(file_name):
+    """Returns the Path object corresponding to a file; relative file names are located in the data directory.
+    """
+
+    path = Path(file_name)
+    return path if path.is_absolute() else get_data_dir() / path
+
+
+def measure_time(f, *args, repeat=5, **kwargs):
+    """Returns the best (minimum) wall-clock time, in seconds, of repeat calls to f(*args, **kwargs).
+    The minimum is used rather than the mean, since it is the least affected by other processes running meanwhile.
+    As in timeit, garbage collection is disabled while timing.
+    """
+
+    best = float('inf')
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            f(*args, **kwargs)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best
+
+
+def measure_memory(f, *args, **kwargs):
+    """Returns a 2-tuple (<result of f(*args, **kwargs)>, <number of bytes allocated by the call and still alive>).
+    Uses tracemalloc, so the call runs noticeably slower than usual; time it separately with measure_time().
+    """
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = f(*args, **kwargs)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+
+def measure_peak_memory(f, *args, **kwargs):
+    """Returns a 2-tuple (<result of f(*args, **kwargs)>, <peak number of bytes allocated during the call>).
+    Like measure_memory(), but for calls whose temporary allocations matter (e.g., generators consumed in a loop).
+    """
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = f(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, peak - before
+
+
 if __name__ == '__main__':
 
     pass